@@ -14,6 +14,7 @@ from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Any, Union
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 
 from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Form, Query
@@ -326,8 +327,22 @@ processing_status = {}
 async def lifespan(app: FastAPI):
     # 启动时
     print("🚀 FastAPI服务器启动")
+    
+    # 按配置限定 asyncio.to_thread 使用的线程池大小（未配置时沿用Python默认值）
+    from src.config import config_manager
+    io_executor = None
+    if config_manager.settings.io_workers:
+        io_executor = ThreadPoolExecutor(max_workers=config_manager.settings.io_workers,
+                                         thread_name_prefix="io")
+        asyncio.get_running_loop().set_default_executor(io_executor)
+        logger.info(f"I/O线程池大小: {config_manager.settings.io_workers}")
+    
     yield
     # 关闭时
+    from src.utils.llm_factory import LLMFactory
+    LLMFactory.close_all()
+    if io_executor is not None:
+        io_executor.shutdown(wait=False)
     print("🛑 FastAPI服务器关闭")
 
 # 创建FastAPI应用
@@ -498,8 +513,11 @@ async def parse_bilibili_video(url: str = Form(...), browser: Optional[str] = Fo
         
         # 验证URL格式
         downloader = BilibiliDownloader(browser=browser, settings=bilibili_config)
-        if not downloader.validate_bilibili_url(url):
-            raise HTTPException(status_code=400, detail="无效的B站视频链接")
+        try:
+            if not downloader.validate_bilibili_url(url):
+                raise HTTPException(status_code=400, detail="无效的B站视频链接")
+        finally:
+            downloader.close()
         
         # 获取视频信息，传递browser参数
         video_info = await get_bilibili_video_info(url, browser, bilibili_config)
@@ -525,8 +543,11 @@ async def create_bilibili_download_task(
         
         # 验证URL格式
         downloader = BilibiliDownloader(settings=bilibili_config)
-        if not downloader.validate_bilibili_url(request.url):
-            raise HTTPException(status_code=400, detail="无效的B站视频链接")
+        try:
+            if not downloader.validate_bilibili_url(request.url):
+                raise HTTPException(status_code=400, detail="无效的B站视频链接")
+        finally:
+            downloader.close()
         
         # 创建下载任务
         task_id = project_manager.create_bilibili_download_task(
@@ -577,9 +598,7 @@ async def get_projects():
     """获取所有项目"""
     try:
         # 使用异步方式获取项目列表，避免阻塞
-        projects = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: list(project_manager.projects.values())
-        )
+        projects = await asyncio.to_thread(lambda: list(project_manager.projects.values()))
         return projects
     except Exception as e:
         logger.error(f"get_projects failed: {e}")
@@ -830,7 +849,10 @@ async def process_bilibili_download_task(
         
         # 下载视频和字幕
         downloader = BilibiliDownloader(temp_download_dir, browser, bilibili_config)
-        download_result = await downloader.download_video_and_subtitle(url, progress_callback)
+        try:
+            download_result = await downloader.download_video_and_subtitle(url, progress_callback, video_info)
+        finally:
+            downloader.close()
         
         if not download_result['video_path']:
             raise Exception("视频下载失败")
@@ -1782,7 +1804,8 @@ async def test_api_key(request: dict):
         # 创建临时LLM客户端测试连接
         try:
             from src.utils.llm_factory import LLMFactory
-            success = LLMFactory.test_connection(provider=provider, api_key=api_key, model=model)
+            # 测试需要等待一次真实的API调用，放到线程中执行，避免阻塞事件循环
+            success = await asyncio.to_thread(LLMFactory.test_connection, provider=provider, api_key=api_key, model=model)
             if success:
                 logger.info("API连接测试成功")
                 return {"success": True}
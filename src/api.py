@@ -67,7 +67,7 @@ async def root():
 @app.get("/health")
 async def health_check():
     """健康检查"""
-    return {"status": "healthy", "timestamp": asyncio.get_event_loop().time()}
+    return {"status": "healthy", "timestamp": asyncio.get_running_loop().time()}
 
 if __name__ == "__main__":
     import uvicorn
@@ -142,6 +142,19 @@ class Settings(BaseModel):
     bilibili_cookies_file: Optional[str] = "/app/data/bilibili_cookies.txt"
     container_mode: str = "auto"  # auto、true、false
     skip_browser_cookies_in_container: bool = True
+    bilibili_use_subprocess: bool = False  # 使用yt-dlp命令行子进程下载（兼容旧行为）
+    bilibili_concurrent_fragments: int = 8  # 分片并发下载数
+    # LLM响应缓存配置
+    llm_response_cache: bool = False  # 相同提示词和输入复用已有响应；默认关闭，因为未通过校验的响应也会被缓存，重试时会原样复用
+    llm_cache_dir: Optional[str] = None  # 响应磁盘缓存目录，None表示只缓存在内存中
+    llm_semantic_cache: bool = False  # 语义缓存：相似请求复用响应，需安装sentence-transformers
+    llm_semantic_cache_threshold: float = 0.95  # 语义缓存命中所需的最低相似度
+    dashscope_use_rest_session: bool = True  # 通义千问通过共享长连接直连REST接口，连接失败时回退SDK
+    llm_max_concurrency: int = 4  # 相互独立的LLM请求最大并发数
+    llm_qps_limit: float = 0  # 每个API密钥每秒最多发送的LLM请求数，0表示不限流
+    llm_compact_input_json: bool = False  # 字典输入以紧凑JSON（不缩进）发送，减少输入token
+    # 并发配置
+    io_workers: Optional[int] = None  # 后台线程池大小，None表示使用Python默认值
     # B站上传配置 (已移除 bilitool 相关功能)
     # bilibili_auto_upload: bool = False
     # bilibili_default_tid: int = 21  # 默认分区：日常
@@ -344,7 +357,9 @@ class ConfigManager:
             'default_browser': self.settings.default_browser,
             'bilibili_cookies_file': self.settings.bilibili_cookies_file,
             'container_mode': self.settings.container_mode,
-            'skip_browser_cookies_in_container': self.settings.skip_browser_cookies_in_container
+            'skip_browser_cookies_in_container': self.settings.skip_browser_cookies_in_container,
+            'bilibili_use_subprocess': self.settings.bilibili_use_subprocess,
+            'bilibili_concurrent_fragments': self.settings.bilibili_concurrent_fragments
         }
     
     # def get_bilibili_config(self) -> BilibiliConfig:
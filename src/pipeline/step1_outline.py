@@ -9,7 +9,7 @@ from pathlib import Path
 
 from ..utils.llm_factory import LLMFactory
 from ..utils.text_processor import TextProcessor
-from ..config import PROMPT_FILES, METADATA_DIR
+from ..config import PROMPT_FILES, METADATA_DIR, config_manager
 
 logger = logging.getLogger(__name__)
 
@@ -72,17 +72,24 @@ class OutlineExtractor:
         
         all_outlines = []
         
-        # 4. 逐一处理每个文本块文件
-        for i, chunk_file in enumerate(chunk_files):
+        # 4. 各文本块相互独立，并发调用LLM
+        llm_items = []
+        for chunk_file in chunk_files:
+            # 读取文本块内容
+            with open(chunk_file, 'r', encoding='utf-8') as f:
+                chunk_text = f.read()
+            llm_items.append((self.outline_prompt, {"text": chunk_text}))
+        
+        max_concurrency = config_manager.settings.llm_max_concurrency
+        logger.info(f"并发处理{len(llm_items)}个文本块，最大并发数: {max_concurrency}")
+        responses = self.llm_client.call_many(llm_items, max_concurrency=max_concurrency)
+        
+        # 5. 按原顺序解析每个文本块的响应
+        for i, (chunk_file, response) in enumerate(zip(chunk_files, responses)):
             logger.info(f"处理第{i+1}/{len(chunks)}个文本块: {chunk_file.name}")
             try:
-                # 读取文本块内容
-                with open(chunk_file, 'r', encoding='utf-8') as f:
-                    chunk_text = f.read()
-                
-                # 为每个块调用LLM
-                input_data = {"text": chunk_text}
-                response = self.llm_client.call_with_retry(self.outline_prompt, input_data)
+                if isinstance(response, Exception):
+                    raise response
                 
                 if response:
                     # 解析响应并附加块索引
@@ -95,7 +102,7 @@ class OutlineExtractor:
                 logger.error(f"处理第{i+1}个文本块失败: {e}")
                 continue
         
-        # 5. 合并和去重
+        # 6. 合并和去重
         final_outlines = self._merge_outlines(all_outlines)
         
         logger.info(f"大纲提取完成，共{len(final_outlines)}个话题")
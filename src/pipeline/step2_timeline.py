@@ -129,7 +129,10 @@ class TimelineExtractor:
                             logger.info(f"  > 📊 [输入统计] 大纲数量: {len(llm_input_outlines)}, SRT条目: {len(srt_chunk_data)}")
                             logger.debug(f"  > 📄 [输入详情] SRT文本前300字符: {srt_text_for_prompt[:300]}...")
                             
-                            raw_response = self.llm_client.call_with_retry(self.timeline_prompt, input_data)
+                            # 解析失败后的重试需要新的响应，不读取缓存
+                            raw_response = self.llm_client.call_with_retry(
+                                self.timeline_prompt, input_data, use_cache=retry_count == 0
+                            )
                             
                             if not raw_response:
                                 logger.warning(f"  > ⚠️ [块 {chunk_index} 空响应] LLM响应为空，跳过")
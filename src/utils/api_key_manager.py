@@ -3,24 +3,85 @@ API密钥管理系统 - 提供安全的密钥存储、验证和轮换功能
 """
 import os
 import json
+import atexit
+import functools
 import hashlib
 import logging
 import tempfile
+import threading
+import time
+import weakref
+from collections import defaultdict
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, DefaultDict
 from datetime import datetime, timedelta
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import base64
 
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，缺失时回退到标准库json
+    orjson = None
+
 from .error_handler import ConfigurationError, APIError, ValidationError
 
 logger = logging.getLogger(__name__)
 
+# 已解封的数据密钥（进程内缓存），键为 sha256(密封文件内容 + 主密码)
+_DATA_KEY_CACHE: Dict[bytes, bytes] = {}
+
+# 存活的管理器实例（弱引用，不延长实例生命周期），进程退出时统一落盘使用统计
+_live_managers: "weakref.WeakSet[APIKeyManager]" = weakref.WeakSet()
+
+@atexit.register
+def _flush_live_managers():
+    """进程退出前保存所有存活实例尚未落盘的使用统计"""
+    for manager in list(_live_managers):
+        try:
+            manager.flush()
+        except Exception as e:
+            logger.warning(f"退出时保存API密钥使用统计失败: {e}")
+
+def _json_dumps(obj: Any, indent: bool = False) -> bytes:
+    """序列化为UTF-8字节，优先使用orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode('utf-8')
+
+def _json_loads(data: bytes) -> Any:
+    """从字节反序列化，优先使用orjson"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+@functools.lru_cache(maxsize=256)
+def _validate_key_format_cached(api_key: str, provider: str) -> bool:
+    """API密钥格式校验（纯函数，结果按进程缓存，容量有限）"""
+    if not api_key or len(api_key.strip()) < 10:
+        return False
+    
+    if provider == "dashscope":
+        # DashScope API密钥通常是sk-开头的字符串
+        return api_key.startswith("sk-") and len(api_key) >= 20
+    
+    # 其他提供商可以添加相应的验证逻辑
+    return True
+
 class APIKeyManager:
     """API密钥管理器"""
     
+    # 使用统计（last_used/usage_count）的延迟落盘时间（秒）
+    USAGE_FLUSH_DELAY = 5.0
+    
+    # 密封数据密钥时PBKDF2的迭代次数（仅在首次创建和启动解封时各执行一次）
+    KDF_ITERATIONS = 600000
+    
+    # 旧版本直接由主密码派生加密密钥的参数，仅用于迁移
+    _LEGACY_SALT = b'auto_clips_salt'
+    _LEGACY_ITERATIONS = 100000
+    
     def __init__(self, storage_path: Optional[Path] = None, master_password: Optional[str] = None):
         """
         初始化API密钥管理器
@@ -31,15 +92,32 @@ class APIKeyManager:
         """
         self.storage_path = storage_path or Path.home() / ".auto_clips" / "api_keys"
         self.master_password = master_password or self._get_master_password()
-        self.fernet = self._create_fernet()
         self.keys_file = self.storage_path / "keys.enc"
         self.metadata_file = self.storage_path / "metadata.json"
+        self.seal_file = self.storage_path / "key.seal"
+        
+        # 存储目录推迟到首次写入时再创建，只读场景不触碰文件系统
+        self._storage_ready = False
+        
+        # 数据密钥为随机生成，由主密码派生的密钥加密后保存在key.seal中
+        self._data_key: Optional[bytes] = None
+        self._seal_pending = False
+        self._legacy_keystore = False
+        self.fernet = self._create_fernet()
         
-        # 确保存储目录存在
-        self.storage_path.mkdir(parents=True, exist_ok=True)
+        # 使用统计只在内存中更新，由定时器合并写盘
+        self._dirty = False
+        self._flush_timer: Optional[threading.Timer] = None
+        _live_managers.add(self)
+        
+        # 同一时刻只允许一个线程加密写盘，并发的保存请求合并为一次补写
+        self._save_lock = threading.Lock()
+        self._save_pending = False
         
         # 加载现有密钥
         self._load_keys()
+        if self._legacy_keystore:
+            self._migrate_legacy_keystore()
     
     def _get_master_password(self) -> str:
         """获取主密码"""
@@ -57,18 +135,85 @@ class APIKeyManager:
             "未设置主密码。请设置 AUTO_CLIPS_MASTER_PASSWORD 环境变量。"
         )
     
-    def _create_fernet(self) -> Fernet:
-        """创建Fernet加密器"""
-        # 使用主密码生成密钥
-        salt = b'auto_clips_salt'  # 在实际应用中应该使用随机salt
+    def _derive_key(self, salt: bytes, iterations: int) -> bytes:
+        """由主密码派生Fernet密钥"""
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
             salt=salt,
-            iterations=100000,
+            iterations=iterations,
         )
-        key = base64.urlsafe_b64encode(kdf.derive(self.master_password.encode()))
-        return Fernet(key)
+        return base64.urlsafe_b64encode(kdf.derive(self.master_password.encode()))
+    
+    def _create_fernet(self) -> Fernet:
+        """创建Fernet加密器"""
+        if self.seal_file.exists():
+            self._data_key = self._unseal_data_key()
+        elif self.keys_file.exists():
+            # 旧版本的密钥库直接用主密码派生的密钥加密，加载后迁移到密封的数据密钥
+            self._legacy_keystore = True
+            return Fernet(self._derive_key(self._LEGACY_SALT, self._LEGACY_ITERATIONS))
+        else:
+            # 首次使用：生成随机数据密钥，首次保存时再写入key.seal
+            self._data_key = Fernet.generate_key()
+            self._seal_pending = True
+        return Fernet(self._data_key)
+    
+    def _unseal_data_key(self) -> bytes:
+        """读取key.seal并用主密码解封数据密钥"""
+        sealed_bytes = self.seal_file.read_bytes()
+        cache_key = self._seal_cache_key(sealed_bytes)
+        data_key = _DATA_KEY_CACHE.get(cache_key)
+        if data_key is not None:
+            return data_key
+        
+        try:
+            sealed = _json_loads(sealed_bytes)
+            salt = base64.b64decode(sealed["salt"])
+            kek = Fernet(self._derive_key(salt, sealed.get("iterations", self.KDF_ITERATIONS)))
+            data_key = kek.decrypt(sealed["wrapped_key"].encode())
+        except InvalidToken:
+            raise ConfigurationError("主密码错误，无法解封API密钥存储")
+        except Exception as e:
+            raise ConfigurationError(f"读取密钥密封文件失败: {e}")
+        
+        _DATA_KEY_CACHE[cache_key] = data_key
+        return data_key
+    
+    def _seal_cache_key(self, sealed_bytes: bytes) -> bytes:
+        """数据密钥缓存键：同一密封文件和主密码只需解封一次"""
+        return hashlib.sha256(sealed_bytes + b"\0" + self.master_password.encode()).digest()
+    
+    def _write_seal(self):
+        """用主密码派生的密钥加密数据密钥，写入key.seal"""
+        salt = os.urandom(16)
+        kek = Fernet(self._derive_key(salt, self.KDF_ITERATIONS))
+        sealed = {
+            "version": 1,
+            "kdf": "pbkdf2-sha256",
+            "iterations": self.KDF_ITERATIONS,
+            "salt": base64.b64encode(salt).decode(),
+            "wrapped_key": kek.encrypt(self._data_key).decode(),
+        }
+        sealed_bytes = _json_dumps(sealed, indent=True)
+        self._atomic_write(self.seal_file, sealed_bytes)
+        self._seal_pending = False
+        _DATA_KEY_CACHE[self._seal_cache_key(sealed_bytes)] = self._data_key
+    
+    def _migrate_legacy_keystore(self):
+        """将旧版本密钥库重新加密到随机数据密钥"""
+        try:
+            self.fernet.decrypt(self.keys_file.read_bytes())
+        except (InvalidToken, OSError) as e:
+            # 无法用当前主密码解密时保持原样，避免覆盖现有数据
+            logger.warning(f"旧版API密钥存储无法解密，跳过迁移: {e}")
+            return
+        
+        self._data_key = Fernet.generate_key()
+        self._seal_pending = True
+        self.fernet = Fernet(self._data_key)
+        self._save_keys()
+        logger.info("API密钥存储已迁移到密封数据密钥")
     
     def _load_keys(self):
         """加载存储的密钥"""
@@ -78,42 +223,142 @@ class APIKeyManager:
             try:
                 with open(self.keys_file, 'rb') as f:
                     encrypted_data = f.read()
+                try:
                     decrypted_data = self.fernet.decrypt(encrypted_data)
-                    self.keys = json.loads(decrypted_data.decode())
+                except InvalidToken:
+                    if self._legacy_keystore:
+                        raise
+                    # 迁移在写入key.seal之后、重写密文之前中断时，密文仍是旧版加密：回退旧版密钥并重新迁移
+                    legacy_fernet = Fernet(self._derive_key(self._LEGACY_SALT, self._LEGACY_ITERATIONS))
+                    decrypted_data = legacy_fernet.decrypt(encrypted_data)
+                    logger.warning("API密钥存储仍为旧版加密（上次迁移未完成），将重新迁移")
+                    self.fernet = legacy_fernet
+                    self._legacy_keystore = True
+                self.keys = _json_loads(decrypted_data)
+                for key_name, key_info in self.keys.items():
+                    # 单个密钥的过期时间损坏时按不过期处理，不能因此丢弃整个密钥库
+                    try:
+                        key_info["_expires_ts"] = self._parse_expires_ts(key_info.get("expires_at"))
+                    except (TypeError, ValueError):
+                        logger.warning(f"API密钥 '{key_name}' 的过期时间无效，按不过期处理: "
+                                       f"{key_info.get('expires_at')!r}")
+                        key_info["_expires_ts"] = None
                 logger.info(f"成功加载 {len(self.keys)} 个API密钥")
             except Exception as e:
                 logger.warning(f"加载API密钥失败: {e}")
                 self.keys = {}
         
+        # 提供商 -> 密钥名称索引（用dict作有序集合，保持插入顺序以便选择结果稳定）
+        self._by_provider: DefaultDict[str, Dict[str, None]] = defaultdict(dict)
+        for key_name, key_info in self.keys.items():
+            self._by_provider[key_info.get("provider")][key_name] = None
+        
         # 加载元数据
         self.metadata: Dict[str, Any] = {}
         if self.metadata_file.exists():
             try:
-                with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                    self.metadata = json.load(f)
+                with open(self.metadata_file, 'rb') as f:
+                    self.metadata = _json_loads(f.read())
             except Exception as e:
                 logger.warning(f"加载API密钥元数据失败: {e}")
                 self.metadata = {}
     
     def _save_keys(self):
-        """保存密钥到文件"""
+        """保存密钥到文件，并发调用时合并写盘"""
+        self._save_pending = True
+        while self._save_pending:
+            if not self._save_lock.acquire(blocking=False):
+                # 其他线程正在写盘，释放锁后会看到待写标记并再写一次
+                return
+            try:
+                self._save_pending = False
+                self._write_keys()
+            finally:
+                self._save_lock.release()
+    
+    def _write_keys(self):
+        """加密并写入密钥文件和元数据"""
         try:
-            # 加密并保存密钥
-            data = json.dumps(self.keys, ensure_ascii=False)
-            encrypted_data = self.fernet.encrypt(data.encode())
+            # 数据密钥必须先于密文落盘，否则重启后无法解密
+            if self._seal_pending:
+                self._write_seal()
             
-            with open(self.keys_file, 'wb') as f:
-                f.write(encrypted_data)
+            # 加密并保存密钥（以下划线开头的字段是内存缓存，不落盘）
+            persisted = {
+                key_name: {k: v for k, v in key_info.items() if not k.startswith("_")}
+                for key_name, key_info in list(self.keys.items())
+            }
+            encrypted_data = self.fernet.encrypt(_json_dumps(persisted))
+            self._atomic_write(self.keys_file, encrypted_data)
             
             # 保存元数据（不加密）
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+            self._atomic_write(self.metadata_file, _json_dumps(self.metadata, indent=True))
             
+            self._dirty = False
             logger.debug("API密钥已保存")
         except Exception as e:
             logger.error(f"保存API密钥失败: {e}")
             raise ConfigurationError(f"保存API密钥失败: {e}")
     
+    def _atomic_write(self, path: Path, data: bytes):
+        """先写入同目录临时文件再原子替换，避免崩溃时留下写了一半的文件"""
+        if not self._storage_ready:
+            if not self.storage_path.is_dir():
+                self.storage_path.mkdir(parents=True, exist_ok=True)
+            self._storage_ready = True
+        tmp = tempfile.NamedTemporaryFile(dir=self.storage_path, prefix=f".{path.name}.",
+                                          suffix=".tmp", delete=False)
+        try:
+            with tmp:
+                tmp.write(data)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp.name, path)
+        except BaseException:
+            try:
+                os.unlink(tmp.name)
+            except OSError:
+                pass
+            raise
+    
+    def _unindex_key(self, key_name: str):
+        """从提供商索引中移除密钥"""
+        provider = self.keys[key_name].get("provider")
+        names = self._by_provider.get(provider)
+        if names is not None:
+            names.pop(key_name, None)
+            if not names:
+                del self._by_provider[provider]
+    
+    @staticmethod
+    def _parse_expires_ts(expires_at: Optional[str]) -> Optional[float]:
+        """将ISO格式的过期时间转换为时间戳，便于快速比较"""
+        if not expires_at:
+            return None
+        return datetime.fromisoformat(expires_at).timestamp()
+    
+    @staticmethod
+    def _is_expired(key_info: Dict[str, Any], now_ts: float) -> bool:
+        """根据缓存的时间戳判断密钥是否过期"""
+        expires_ts = key_info.get("_expires_ts")
+        return expires_ts is not None and now_ts > expires_ts
+    
+    def _mark_dirty(self):
+        """标记使用统计有未保存的修改，并安排一次延迟写盘"""
+        self._dirty = True
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.USAGE_FLUSH_DELAY, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def flush(self):
+        """立即保存尚未落盘的使用统计"""
+        timer, self._flush_timer = self._flush_timer, None
+        if timer is not None:
+            timer.cancel()
+        if self._dirty:
+            self._save_keys()
+    
     def add_api_key(self, key_name: str, api_key: str, provider: str = "dashscope", 
                    description: str = "", expires_at: Optional[datetime] = None) -> bool:
         """
@@ -137,6 +382,7 @@ class APIKeyManager:
             # 检查密钥是否已存在
             if key_name in self.keys:
                 logger.warning(f"密钥名称 '{key_name}' 已存在，将被覆盖")
+                self._unindex_key(key_name)
             
             # 存储密钥信息
             self.keys[key_name] = {
@@ -147,8 +393,11 @@ class APIKeyManager:
                 "expires_at": expires_at.isoformat() if expires_at else None,
                 "last_used": None,
                 "usage_count": 0,
-                "is_active": True
+                "is_active": True,
+                "_expires_ts": expires_at.timestamp() if expires_at else None,
+                "_format_valid": True
             }
+            self._by_provider[provider][key_name] = None
             
             # 更新元数据
             self.metadata["last_updated"] = datetime.now().isoformat()
@@ -185,16 +434,14 @@ class APIKeyManager:
             return None
         
         # 检查是否过期
-        if key_info.get("expires_at"):
-            expires_at = datetime.fromisoformat(key_info["expires_at"])
-            if datetime.now() > expires_at:
-                logger.warning(f"API密钥 '{key_name}' 已过期")
-                return None
+        if self._is_expired(key_info, time.time()):
+            logger.warning(f"API密钥 '{key_name}' 已过期")
+            return None
         
-        # 更新使用统计
+        # 更新使用统计（仅更新内存，延迟合并写盘）
         key_info["last_used"] = datetime.now().isoformat()
         key_info["usage_count"] = key_info.get("usage_count", 0) + 1
-        self._save_keys()
+        self._mark_dirty()
         
         return key_info["api_key"]
     
@@ -208,26 +455,18 @@ class APIKeyManager:
         Returns:
             活跃的API密钥，如果没有则返回None
         """
-        active_keys = []
-        
-        for key_name, key_info in self.keys.items():
-            if (key_info.get("provider") == provider and 
-                key_info.get("is_active", True)):
-                
-                # 检查是否过期
-                if key_info.get("expires_at"):
-                    expires_at = datetime.fromisoformat(key_info["expires_at"])
-                    if datetime.now() > expires_at:
-                        continue
-                
-                active_keys.append((key_name, key_info))
-        
-        if not active_keys:
-            return None
-        
-        # 优先返回最近使用的密钥
-        active_keys.sort(key=lambda x: x[1].get("last_used", ""), reverse=True)
-        return active_keys[0][1]["api_key"]
+        now_ts = time.time()
+        best_info = None
+        
+        # 只遍历该提供商的密钥，优先返回最近使用的密钥
+        for key_name in self._by_provider.get(provider, ()):
+            key_info = self.keys[key_name]
+            if not key_info.get("is_active", True) or self._is_expired(key_info, now_ts):
+                continue
+            if best_info is None or (key_info.get("last_used") or "") > (best_info.get("last_used") or ""):
+                best_info = key_info
+        
+        return best_info["api_key"] if best_info else None
     
     def remove_api_key(self, key_name: str) -> bool:
         """
@@ -243,6 +482,7 @@ class APIKeyManager:
             logger.warning(f"API密钥 '{key_name}' 不存在")
             return False
         
+        self._unindex_key(key_name)
         del self.keys[key_name]
         self.metadata["last_updated"] = datetime.now().isoformat()
         self.metadata["total_keys"] = len(self.keys)
@@ -271,9 +511,10 @@ class APIKeyManager:
         
         for field, value in updates.items():
             if field in allowed_fields:
-                if field == "expires_at" and value is not None:
+                if field == "expires_at":
                     if isinstance(value, datetime):
                         value = value.isoformat()
+                    self.keys[key_name]["_expires_ts"] = self._parse_expires_ts(value)
                 self.keys[key_name][field] = value
         
         self.metadata["last_updated"] = datetime.now().isoformat()
@@ -290,6 +531,7 @@ class APIKeyManager:
             API密钥信息列表
         """
         result = []
+        now_ts = time.time()
         
         for key_name, key_info in self.keys.items():
             # 不返回实际的API密钥值
@@ -305,11 +547,7 @@ class APIKeyManager:
             }
             
             # 检查是否过期
-            if key_info.get("expires_at"):
-                expires_at = datetime.fromisoformat(key_info["expires_at"])
-                safe_info["is_expired"] = datetime.now() > expires_at
-            else:
-                safe_info["is_expired"] = False
+            safe_info["is_expired"] = self._is_expired(key_info, now_ts)
             
             result.append(safe_info)
         
@@ -334,8 +572,14 @@ class APIKeyManager:
         
         try:
             # 这里可以添加实际的API测试逻辑
-            # 目前只是简单的格式验证
-            if self._validate_api_key_format(api_key, "dashscope"):
+            # 目前只是简单的格式验证，结果缓存在密钥信息中（旧数据首次测试时补算）
+            key_info = self.keys[key_name]
+            format_valid = key_info.get("_format_valid")
+            if format_valid is None:
+                format_valid = self._validate_api_key_format(api_key, key_info.get("provider", "dashscope"))
+                key_info["_format_valid"] = format_valid
+            
+            if format_valid:
                 return {
                     "success": True,
                     "message": "API密钥格式正确"
@@ -362,15 +606,7 @@ class APIKeyManager:
         Returns:
             格式是否正确
         """
-        if not api_key or len(api_key.strip()) < 10:
-            return False
-        
-        if provider == "dashscope":
-            # DashScope API密钥通常是sk-开头的字符串
-            return api_key.startswith("sk-") and len(api_key) >= 20
-        
-        # 其他提供商可以添加相应的验证逻辑
-        return True
+        return _validate_key_format_cached(api_key, provider)
     
     def rotate_api_key(self, key_name: str, new_api_key: str) -> bool:
         """
@@ -398,6 +634,7 @@ class APIKeyManager:
         self.keys[key_name]["rotated_at"] = datetime.now().isoformat()
         self.keys[key_name]["last_used"] = None
         self.keys[key_name]["usage_count"] = 0
+        self.keys[key_name]["_format_valid"] = True
         
         self.metadata["last_updated"] = datetime.now().isoformat()
         self._save_keys()
@@ -413,15 +650,18 @@ class APIKeyManager:
             使用统计信息
         """
         total_keys = len(self.keys)
-        active_keys = sum(1 for k in self.keys.values() if k.get("is_active", True))
+        active_keys = 0
         expired_keys = 0
         total_usage = 0
+        now_ts = time.time()
         
+        # 单次遍历同时统计活跃、过期和使用次数
         for key_info in self.keys.values():
-            if key_info.get("expires_at"):
-                expires_at = datetime.fromisoformat(key_info["expires_at"])
-                if datetime.now() > expires_at:
-                    expired_keys += 1
+            if key_info.get("is_active", True):
+                active_keys += 1
+            
+            if self._is_expired(key_info, now_ts):
+                expired_keys += 1
             
             total_usage += key_info.get("usage_count", 0)
         
@@ -441,27 +681,45 @@ class APIKeyManager:
             清理的密钥数量
         """
         cleaned_count = 0
-        current_time = datetime.now()
-        
-        keys_to_remove = []
+        now_ts = time.time()
         
-        for key_name, key_info in self.keys.items():
-            if key_info.get("expires_at"):
-                expires_at = datetime.fromisoformat(key_info["expires_at"])
-                if current_time > expires_at:
-                    keys_to_remove.append(key_name)
+        keys_to_remove = [
+            key_name for key_name, key_info in self.keys.items()
+            if self._is_expired(key_info, now_ts)
+        ]
         
         for key_name in keys_to_remove:
-            self.remove_api_key(key_name)
+            self._unindex_key(key_name)
+            del self.keys[key_name]
             cleaned_count += 1
         
+        # 批量删除后只保存一次
         if cleaned_count > 0:
+            self.metadata["last_updated"] = datetime.now().isoformat()
+            self.metadata["total_keys"] = len(self.keys)
+            self._save_keys()
             logger.info(f"清理了 {cleaned_count} 个过期的API密钥")
         
         return cleaned_count
 
-# 全局API密钥管理器实例
-api_key_manager = APIKeyManager()
+# 全局API密钥管理器实例（延迟初始化，避免导入时执行PBKDF2和文件读取）
+_manager: Optional[APIKeyManager] = None
+_manager_lock = threading.Lock()
+
+def _get_manager() -> APIKeyManager:
+    """获取全局API密钥管理器，首次调用时才创建"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = APIKeyManager()
+    return _manager
+
+def __getattr__(name: str):
+    # 兼容 `from api_key_manager import api_key_manager` 的旧用法
+    if name == "api_key_manager":
+        return _get_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_api_key(key_name: Optional[str] = None, provider: str = "dashscope") -> Optional[str]:
     """
@@ -474,10 +732,11 @@ def get_api_key(key_name: Optional[str] = None, provider: str = "dashscope") ->
     Returns:
         API密钥
     """
+    manager = _get_manager()
     if key_name:
-        return api_key_manager.get_api_key(key_name)
+        return manager.get_api_key(key_name)
     else:
-        return api_key_manager.get_active_api_key(provider)
+        return manager.get_active_api_key(provider)
 
 def set_api_key(api_key: str, key_name: str = "default", provider: str = "dashscope") -> bool:
     """
@@ -491,4 +750,4 @@ def set_api_key(api_key: str, key_name: str = "default", provider: str = "dashsc
     Returns:
         是否设置成功
     """
-    return api_key_manager.add_api_key(key_name, api_key, provider) 
\ No newline at end of file
+    return _get_manager().add_api_key(key_name, api_key, provider)
\ No newline at end of file
@@ -7,9 +7,15 @@ B站视频下载器 - 基于yt-dlp实现B站视频和字幕下载
 import os
 import re
 import asyncio
+import functools
 import logging
+import shutil
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, Optional, Callable
+from typing import Dict, Any, Optional, Callable, List, Tuple, Iterator
 from datetime import datetime
 import yt_dlp
 import subprocess
@@ -24,6 +30,89 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# B站视频链接格式（BV号、av号、b23.tv短链），模块加载时编译一次；
+# video_id分组同时用作视频信息缓存的键，短链没有该分组
+_BILIBILI_URL_RE = re.compile(
+    r'https?://(?:(?:www\.)?bilibili\.com/video/(?P<video_id>[Bb][Vv][0-9A-Za-z]+|av\d+)|b23\.tv/[0-9A-Za-z]+)'
+)
+
+# 文件名中的不安全字符统一替换为下划线
+_UNSAFE_FILENAME_CHARS = frozenset('<>:"/\\|?*')
+_UNSAFE_FILENAME_TABLE = str.maketrans({c: '_' for c in _UNSAFE_FILENAME_CHARS})
+
+# 下载中断后可能残留的临时文件后缀
+_TEMP_FILE_SUFFIXES = ('.part', '.tmp', '.ytdl')
+
+# VTT时间戳使用点分隔毫秒，SRT使用逗号
+_VTT_TO_SRT_TIME_TABLE = str.maketrans('.', ',')
+
+# 视频文件扩展名，按优先级排列
+_VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.webm', '.flv')
+
+# yt-dlp命令行的进度输出模板：每次进度一行，直接输出数值字段，按 | 分隔
+_PROGRESS_PREFIX = 'PROGRESS|'
+_PROGRESS_FIELDS = ('downloaded_bytes', 'total_bytes', 'total_bytes_estimate', 'speed', 'eta')
+_PROGRESS_TEMPLATE = 'download:' + _PROGRESS_PREFIX + '|'.join(f'%(progress.{field})s' for field in _PROGRESS_FIELDS)
+
+# 进程内同时进行的下载数上限（所有下载器实例共享）。
+# 实际并发连接数约为 该上限 × 分片并发数(bilibili_concurrent_fragments)，两者应一起调整
+_MAX_CONCURRENT_DOWNLOADS = max(1, int(os.getenv('BILIBILI_MAX_CONCURRENT_DOWNLOADS', '4')))
+_DOWNLOAD_SEMAPHORES: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]' = weakref.WeakKeyDictionary()
+
+# 分P参数，与视频ID一起组成缓存键
+_VIDEO_PAGE_RE = re.compile(r'[?&]p=(\d+)')
+
+# 视频信息缓存：规范化视频ID -> (写入时间, 视频信息)，跨下载器实例共享
+_VIDEO_INFO_CACHE: Dict[str, Tuple[float, 'BilibiliVideoInfo']] = {}
+_VIDEO_INFO_CACHE_TTL = 300.0
+_VIDEO_INFO_CACHE_MAX = 256
+
+@functools.lru_cache(maxsize=1)
+def _detect_container_environment() -> bool:
+    """
+    检测是否在容器环境中运行，结果在进程内缓存
+    
+    Returns:
+        是否在容器环境中
+    """
+    # 检查常见的容器环境标识
+    container_indicators = [
+        Path('/.dockerenv'),  # Docker环境标识文件
+        Path('/run/.containerenv'),  # Podman环境标识文件
+    ]
+    
+    for indicator in container_indicators:
+        if indicator.exists():
+            return True
+    
+    # 检查环境变量
+    if os.getenv('CONTAINER_MODE') == 'true':
+        return True
+    
+    # 检查cgroup信息（Docker容器特征）
+    try:
+        with open('/proc/1/cgroup', 'r') as f:
+            content = f.read()
+            if 'docker' in content or 'containerd' in content:
+                return True
+    except (FileNotFoundError, PermissionError):
+        pass
+    
+    return False
+
+@functools.lru_cache(maxsize=1)
+def _ffmpeg_available() -> bool:
+    """检测ffmpeg是否可用，结果在进程内缓存"""
+    return shutil.which('ffmpeg') is not None
+
+def _download_semaphore() -> asyncio.Semaphore:
+    """获取当前事件循环的下载并发信号量（asyncio.Semaphore只能在一个事件循环中使用）"""
+    loop = asyncio.get_running_loop()
+    semaphore = _DOWNLOAD_SEMAPHORES.get(loop)
+    if semaphore is None:
+        semaphore = _DOWNLOAD_SEMAPHORES[loop] = asyncio.Semaphore(_MAX_CONCURRENT_DOWNLOADS)
+    return semaphore
+
 class BilibiliVideoInfo:
     """B站视频信息类"""
     def __init__(self, info_dict: Dict[str, Any]):
@@ -70,12 +159,21 @@ B站视频下载器
         self.settings = settings or {}
         self.download_dir.mkdir(parents=True, exist_ok=True)
         
+        # 空闲的YoutubeDL实例池，按选项分组复用，避免每次重新初始化提取器和cookies
+        self._ydl_pool: Dict[frozenset, List[yt_dlp.YoutubeDL]] = {}
+        self._ydl_pool_lock = threading.Lock()
+        
         # 检测容器环境
         self.is_container = self._detect_container_environment()
         
         # 获取cookies配置
         self.cookies_file = self.settings.get('bilibili_cookies_file', '/app/data/bilibili_cookies.txt')
         self.skip_browser_cookies = self.settings.get('skip_browser_cookies_in_container', True)
+        self.refresh_cookies()
+        # 兼容选项：改回调用yt-dlp命令行子进程下载
+        self.use_subprocess = self.settings.get('bilibili_use_subprocess', False)
+        # DASH/HLS分片并发下载数，分片请求以往返延迟为主，并发可显著缩短总耗时
+        self.concurrent_fragments = max(1, int(self.settings.get('bilibili_concurrent_fragments', 8)))
         
         # 记录环境信息
         if self.is_container:
@@ -87,35 +185,37 @@ B站视频下载器
     
     def _detect_container_environment(self) -> bool:
         """
-        检测是否在容器环境中运行
+        检测是否在容器环境中运行（进程内只实际检测一次）
         
         Returns:
             是否在容器环境中
         """
-        # 检查常见的容器环境标识
-        container_indicators = [
-            Path('/.dockerenv'),  # Docker环境标识文件
-            Path('/run/.containerenv'),  # Podman环境标识文件
-        ]
-        
-        for indicator in container_indicators:
-            if indicator.exists():
-                return True
-        
-        # 检查环境变量
-        if os.getenv('CONTAINER_MODE') == 'true':
-            return True
+        return _detect_container_environment()
+    
+    def refresh_cookies(self):
+        """重新检查cookies文件是否存在并重建公共选项（更新或删除cookies文件后调用）"""
+        self._cookies_exists = bool(self.cookies_file) and Path(self.cookies_file).exists()
+        self._base_opts = self._build_base_opts()
+    
+    def _build_base_opts(self) -> Dict[str, Any]:
+        """构建获取信息和下载共用的yt-dlp选项（输出级别与cookies来源）"""
+        base_opts: Dict[str, Any] = {'quiet': True}
         
-        # 检查cgroup信息（Docker容器特征）
-        try:
-            with open('/proc/1/cgroup', 'r') as f:
-                content = f.read()
-                if 'docker' in content or 'containerd' in content:
-                    return True
-        except (FileNotFoundError, PermissionError):
-            pass
+        # 容器环境适配
+        if self.is_container and self.skip_browser_cookies:
+            logger.info("容器环境：跳过cookies-from-browser参数")
+            # 尝试使用cookies文件（如果存在）
+            if self._cookies_exists:
+                base_opts['cookiefile'] = self.cookies_file
+                logger.info(f"使用cookies文件: {self.cookies_file}")
+            else:
+                logger.info("未找到cookies文件，将以匿名模式访问")
+        elif self.browser:
+            # Python API的参数名为cookiesfrombrowser，取值为(浏览器, 配置, 密钥环, 容器)元组
+            base_opts['cookiesfrombrowser'] = (self.browser.lower(),)
+            logger.info(f"yt-dlp cookiesfrombrowser: {self.browser.lower()}")
         
-        return False
+        return base_opts
         
     def validate_bilibili_url(self, url: str) -> bool:
         """
@@ -127,15 +227,26 @@ B站视频下载器
         Returns:
             是否为有效的B站链接
         """
-        bilibili_patterns = [
-            r'https?://www\.bilibili\.com/video/[Bb][Vv][0-9A-Za-z]+',
-            r'https?://bilibili\.com/video/[Bb][Vv][0-9A-Za-z]+',
-            r'https?://b23\.tv/[0-9A-Za-z]+',
-            r'https?://www\.bilibili\.com/video/av\d+',
-            r'https?://bilibili\.com/video/av\d+'
-        ]
-        
-        return any(re.match(pattern, url) for pattern in bilibili_patterns)
+        # 先用简单的字符串判断排除明显不是B站的链接，再交给正则
+        if not url or not url.startswith(('http://', 'https://')):
+            return False
+        if 'bilibili.com' not in url and 'b23.tv' not in url:
+            return False
+        return _BILIBILI_URL_RE.match(url) is not None
+    
+    @staticmethod
+    def _video_cache_key(url: str, match: re.Match) -> str:
+        """规范化视频链接：BV号统一大写前缀，只保留分P参数；短链按去参数后的地址缓存"""
+        url = url.strip()
+        video_id = match.group('video_id')
+        if video_id:
+            if video_id[:2].lower() == 'bv':
+                video_id = 'BV' + video_id[2:]
+            page = _VIDEO_PAGE_RE.search(url)
+            if page and page.group(1) != '1':
+                video_id += f'?p={page.group(1)}'
+            return video_id
+        return url.split('#', 1)[0].split('?', 1)[0].rstrip('/')
     
     async def get_video_info(self, url: str) -> BilibiliVideoInfo:
         """
@@ -147,48 +258,82 @@ B站视频下载器
         Returns:
             视频信息对象
         """
-        if not self.validate_bilibili_url(url):
+        # 校验与缓存键共用一次正则匹配
+        match = _BILIBILI_URL_RE.match(url)
+        if match is None:
             raise ValidationError(f"无效的B站视频链接: {url}")
         
+        cache_key = self._video_cache_key(url, match)
+        cached = _VIDEO_INFO_CACHE.get(cache_key)
+        if cached is not None and time.monotonic() - cached[0] < _VIDEO_INFO_CACHE_TTL:
+            return cached[1]
+        
         ydl_opts = {
-            'quiet': True,
+            **self._base_opts,
             'no_warnings': True,
         }
         
-        # 容器环境适配
-        if self.is_container and self.skip_browser_cookies:
-            logger.info("容器环境：跳过cookies-from-browser参数")
-            # 尝试使用cookies文件（如果存在）
-            if Path(self.cookies_file).exists():
-                ydl_opts['cookiefile'] = self.cookies_file
-                logger.info(f"使用cookies文件: {self.cookies_file}")
-            else:
-                logger.info("未找到cookies文件，将以匿名模式访问")
-        elif self.browser:
-            ydl_opts['cookies_from_browser'] = self.browser.lower()
-            logger.info(f'yt-dlp cookies_from_browser: {ydl_opts.get("cookies_from_browser")}')
-        
         try:
-            loop = asyncio.get_event_loop()
-            info_dict = await loop.run_in_executor(
-                None, 
-                self._extract_info_sync, 
-                url, 
-                ydl_opts
-            )
-            return BilibiliVideoInfo(info_dict)
+            info_dict = await asyncio.to_thread(self._extract_info_sync, url, ydl_opts)
+            video_info = BilibiliVideoInfo(info_dict)
+            if len(_VIDEO_INFO_CACHE) >= _VIDEO_INFO_CACHE_MAX:
+                # 淘汰最早写入的条目
+                _VIDEO_INFO_CACHE.pop(next(iter(_VIDEO_INFO_CACHE)), None)
+            _VIDEO_INFO_CACHE[cache_key] = (time.monotonic(), video_info)
+            return video_info
         except Exception as e:
             raise ProcessingError(f"获取视频信息失败: {str(e)}")
     
     def _extract_info_sync(self, url: str, ydl_opts: Dict[str, Any]) -> Dict[str, Any]:
         """同步方式提取视频信息"""
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with self._pooled_ydl(ydl_opts) as ydl:
             return ydl.extract_info(url, download=False)
     
+    @staticmethod
+    def _freeze_option(value: Any) -> Any:
+        """将yt-dlp选项值转换为可哈希形式，回调函数按对象身份区分"""
+        if callable(value):
+            return ('callable', id(value))
+        if isinstance(value, (list, tuple)):
+            return tuple(BilibiliDownloader._freeze_option(v) for v in value)
+        if isinstance(value, dict):
+            return frozenset((k, BilibiliDownloader._freeze_option(v)) for k, v in value.items())
+        if isinstance(value, set):
+            return frozenset(value)
+        return value
+    
+    @contextmanager
+    def _pooled_ydl(self, ydl_opts: Dict[str, Any]) -> Iterator[yt_dlp.YoutubeDL]:
+        """从实例池借出一个YoutubeDL，用完后归还；同一实例同一时间只被一个线程使用"""
+        key = frozenset((k, self._freeze_option(v)) for k, v in ydl_opts.items())
+        with self._ydl_pool_lock:
+            idle = self._ydl_pool.get(key)
+            ydl = idle.pop() if idle else None
+        if ydl is None:
+            # YoutubeDL会原地修改传入的选项，传副本以保证池键稳定
+            ydl = yt_dlp.YoutubeDL(dict(ydl_opts))
+        try:
+            yield ydl
+        finally:
+            with self._ydl_pool_lock:
+                self._ydl_pool.setdefault(key, []).append(ydl)
+    
+    def close(self):
+        """关闭实例池中的所有YoutubeDL（保存cookies并释放网络连接）"""
+        with self._ydl_pool_lock:
+            pooled = [ydl for idle in self._ydl_pool.values() for ydl in idle]
+            self._ydl_pool.clear()
+        for ydl in pooled:
+            try:
+                ydl.close()
+            except Exception as e:
+                logger.warning(f"关闭yt-dlp实例失败: {e}")
+    
     async def download_video_and_subtitle(
         self, 
         url: str, 
-        progress_callback: Optional[Callable[[str, float], None]] = None
+        progress_callback: Optional[Callable[[str, float], None]] = None,
+        video_info: Optional[BilibiliVideoInfo] = None
     ) -> Dict[str, str]:
         """
         下载视频和字幕文件
@@ -196,6 +341,8 @@ B站视频下载器
         Args:
             url: 视频链接
             progress_callback: 进度回调函数，参数为(状态信息, 进度百分比)
+            video_info: 已获取的视频信息；未传入时进程内下载直接使用下载返回的信息，
+                不再单独请求元数据
             
         Returns:
             包含video_path和subtitle_path的字典
@@ -203,57 +350,65 @@ B站视频下载器
         if not self.validate_bilibili_url(url):
             raise ValidationError(f"无效的B站视频链接: {url}")
         
-        # 获取视频信息
-        video_info = await self.get_video_info(url)
-        
-        # 清理文件名，移除特殊字符
-        safe_title = self._sanitize_filename(video_info.title)
+        # 超出全局并发上限的下载在此排队
+        async with _download_semaphore():
+            return await self._download_video_and_subtitle(url, progress_callback, video_info)
+    
+    async def _download_video_and_subtitle(
+        self,
+        url: str,
+        progress_callback: Optional[Callable[[str, float], None]],
+        video_info: Optional[BilibiliVideoInfo]
+    ) -> Dict[str, str]:
+        """下载视频和字幕文件（调用方已校验链接并持有并发名额）"""
+        # 命令行方式需要预先知道标题；进程内下载由yt-dlp按标题命名并在下载时返回视频信息
+        if video_info is None and self.use_subprocess:
+            video_info = await self.get_video_info(url)
+        
+        if video_info is not None:
+            # 清理文件名，移除特殊字符
+            safe_title = self._sanitize_filename(video_info.title)
+            outtmpl = str(self.download_dir / f'{safe_title}.%(ext)s')
+        else:
+            # yt-dlp自行清理标题中的不安全字符，并按字节数截断
+            safe_title = None
+            outtmpl = str(self.download_dir / '%(title).100B.%(ext)s')
         
         # 设置下载选项 - 专注AI字幕
         ydl_opts = {
+            **self._base_opts,
             'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
             'writeautosub': True,  # 下载AI字幕
             'writesubtitles': True,  # 下载普通字幕
             'subtitleslangs': ['ai-zh'],  # 专注AI字幕
             'subtitlesformat': 'srt',  # 强制SRT格式
-            'outtmpl': str(self.download_dir / f'{safe_title}.%(ext)s'),
+            'outtmpl': outtmpl,
             'noplaylist': True,
-            'quiet': True,
             'progress': True,
+            'concurrent_fragment_downloads': self.concurrent_fragments,
         }
         
-        # 容器环境适配
-        if self.is_container and self.skip_browser_cookies:
-            logger.info("容器环境：跳过cookies-from-browser参数")
-            # 尝试使用cookies文件（如果存在）
-            if Path(self.cookies_file).exists():
-                ydl_opts['cookiefile'] = self.cookies_file
-                logger.info(f"使用cookies文件: {self.cookies_file}")
-            else:
-                logger.info("未找到cookies文件，将以匿名模式访问")
-        elif self.browser:
-            ydl_opts['cookies_from_browser'] = self.browser.lower()
-            logger.info(f'yt-dlp cookies_from_browser: {ydl_opts.get("cookies_from_browser")}')
-        
-        # 添加进度钩子
-        if progress_callback:
-            ydl_opts['progress_hooks'] = [self._create_progress_hook(progress_callback)]
+        # 上游只提供WebVTT时，由ffmpeg把字幕转换为SRT，无需在Python中逐行转换
+        if _ffmpeg_available():
+            ydl_opts['postprocessors'] = [
+                {'key': 'FFmpegSubtitlesConvertor', 'format': 'srt', 'when': 'before_dl'}
+            ]
         
         try:
             if progress_callback:
                 progress_callback("开始下载视频和字幕...", 0)
             
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None,
-                self._download_sync,
-                url,
-                ydl_opts
-            )
+            if self.use_subprocess:
+                await self._download_subprocess(url, ydl_opts, progress_callback)
+            else:
+                progress_hook = self._create_progress_hook(progress_callback) if progress_callback else None
+                info_dict, file_title = await asyncio.to_thread(self._download_sync, url, ydl_opts, progress_hook)
+                if video_info is None:
+                    video_info = BilibiliVideoInfo(info_dict)
+                    safe_title = file_title
             
-            # 查找下载的文件
-            video_path = self._find_downloaded_video(safe_title)
-            subtitle_path = self._find_downloaded_subtitle(safe_title)
+            # 查找下载的文件（单次扫描目录，可能重命名字幕），放到线程中执行以免阻塞事件循环
+            video_path, subtitle_path = await asyncio.to_thread(self._scan_downloads, safe_title)
             
             if progress_callback:
                 progress_callback("下载完成", 100)
@@ -273,21 +428,67 @@ B站视频下载器
                 progress_callback(error_msg, 0)
             raise ProcessingError(error_msg)
     
-    def _download_sync(self, url: str, ydl_opts: Dict[str, Any]):
-        """同步方式下载 - 使用subprocess确保容器环境适配，并支持进度回调"""
+    async def download_many(
+        self,
+        urls: List[str],
+        concurrency: int = 4,
+        progress_callback: Optional[Callable[[str, str, float], None]] = None
+    ) -> List[Any]:
+        """
+        批量下载多个视频和字幕
+        
+        同一时间最多处理concurrency个视频，同时受进程级下载并发上限
+        （BILIBILI_MAX_CONCURRENT_DOWNLOADS）约束。实际连接数约为 并发视频数 × 分片并发数，
+        两者应一起调整。
+        
+        Args:
+            urls: 视频链接列表
+            concurrency: 同时进行的最大视频数
+            progress_callback: 进度回调函数，参数为(视频链接, 状态信息, 进度百分比)
+            
+        Returns:
+            与urls顺序一致的结果列表，成功为download_video_and_subtitle的返回值，
+            失败为对应的异常对象
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        async def _download_one(url: str):
+            async with semaphore:
+                callback = None
+                if progress_callback:
+                    callback = lambda status, progress: progress_callback(url, status, progress)
+                return await self.download_video_and_subtitle(url, callback)
+        
+        return await asyncio.gather(*(_download_one(url) for url in urls), return_exceptions=True)
+    
+    def _download_sync(self, url: str, ydl_opts: Dict[str, Any],
+                       progress_hook: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[Dict[str, Any], str]:
+        """
+        同步方式下载 - 在进程内调用yt-dlp，进度通过progress_hooks回调
+        
+        Returns:
+            (视频信息字典, 下载文件名去掉扩展名的部分)
+        """
+        # 输出模板随标题变化，下载实例无法复用，不放入实例池
+        download_opts = dict(ydl_opts)
+        if progress_hook:
+            download_opts['progress_hooks'] = [progress_hook]
+        
+        # extract_info(download=True)在下载的同时返回视频信息，省去一次单独的元数据请求
+        with yt_dlp.YoutubeDL(download_opts) as ydl:
+            info_dict = ydl.extract_info(url, download=True)
+            file_title = Path(ydl.prepare_filename(info_dict)).stem
+        
+        return info_dict, file_title
+    
+    async def _download_subprocess(self, url: str, ydl_opts: Dict[str, Any],
+                                   progress_callback: Optional[Callable[[str, float], None]] = None):
+        """异步方式下载 - 使用asyncio子进程调用yt-dlp命令行，在事件循环中解析输出中的进度"""
         # 构造yt-dlp命令
         safe_title = ydl_opts.get('outtmpl', '').split('/')[-1].replace('%(ext)s', '')
         if not safe_title:
             safe_title = "video"
         
-        # 获取进度回调函数
-        progress_callback = None
-        if 'progress_hooks' in ydl_opts and ydl_opts['progress_hooks']:
-            # 从第一个hook中提取回调函数
-            original_hook = ydl_opts['progress_hooks'][0]
-            if hasattr(original_hook, '__closure__') and original_hook.__closure__:
-                progress_callback = original_hook.__closure__[0].cell_contents
-        
         # 构造基本命令
         cmd = [
             "yt-dlp",
@@ -296,61 +497,46 @@ B站视频下载器
             "--sub-format", "srt",
             "--output", f"{safe_title}.%(ext)s",  # 只用文件名
             "--progress",  # 启用进度输出
+            "--newline",
+            "--progress-template", _PROGRESS_TEMPLATE,  # 只输出数值，无需正则解析
+            "--concurrent-fragments", str(self.concurrent_fragments),
         ]
         
-        # 容器环境适配
-        if self.is_container and self.skip_browser_cookies:
-            logger.info("容器环境：跳过--cookies-from-browser参数")
-            # 尝试使用cookies文件（如果存在）
-            if Path(self.cookies_file).exists():
-                cmd.extend(["--cookies", self.cookies_file])
-                logger.info(f"使用cookies文件: {self.cookies_file}")
-            else:
-                logger.info("未找到cookies文件，将以匿名模式访问")
-        elif self.browser:
-            browser = self.browser.lower()
-            cmd.extend(["--cookies-from-browser", browser])
-            logger.info(f"使用浏览器cookies: {browser}")
+        if 'postprocessors' in ydl_opts:
+            cmd.extend(["--convert-subs", "srt"])
+        
+        # cookies来源与公共选项保持一致
+        if 'cookiefile' in ydl_opts:
+            cmd.extend(["--cookies", ydl_opts['cookiefile']])
+        elif 'cookiesfrombrowser' in ydl_opts:
+            cmd.extend(["--cookies-from-browser", ydl_opts['cookiesfrombrowser'][0]])
         
         cmd.append(url)
         
         logger.info(f"[subprocess] yt-dlp命令: {' '.join(cmd)}")
         
-        # 执行命令并实时解析进度
-        import subprocess
-        import re
-        
-        process = subprocess.Popen(
-            cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.STDOUT,
-            text=True,
-            cwd=str(self.download_dir),
-            bufsize=1,
-            universal_newlines=True
+        # 执行命令并实时解析进度，等待输出时不占用线程池
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            cwd=str(self.download_dir)
         )
         
-        # 解析进度信息
-        progress_pattern = re.compile(r'\[download\]\s+(\d+\.?\d*)%')
+        # 进度行交给与进程内下载相同的钩子处理，其余输出照常记录
+        progress_hook = self._create_progress_hook(progress_callback) if progress_callback else None
         
-        while True:
-            output = process.stdout.readline()
-            if output == '' and process.poll() is not None:
-                break
+        async for raw_line in process.stdout:
+            output = raw_line.decode('utf-8', 'replace')
+            if output.startswith(_PROGRESS_PREFIX):
+                if progress_hook:
+                    progress_hook(self._parse_progress_line(output))
+                continue
+            output = output.strip()
             if output:
-                logger.info(f"[subprocess] {output.strip()}")
-                
-                # 解析进度
-                if progress_callback:
-                    match = progress_pattern.search(output)
-                    if match:
-                        try:
-                            progress = float(match.group(1))
-                            progress_callback(f"下载中... {progress:.1f}%", progress)
-                        except ValueError:
-                            pass
-        
-        result = process.poll()
+                logger.info(f"[subprocess] {output}")
+        
+        result = await process.wait()
         if result != 0:
             logger.error(f"yt-dlp命令执行失败，返回码: {result}")
         
@@ -370,25 +556,32 @@ B站视频下载器
         else:
             logger.warning(f"[subprocess] 未找到字幕文件，标题: {safe_title}")
     
+    @staticmethod
+    def _parse_progress_line(line: str) -> Dict[str, Any]:
+        """把进度模板输出的一行转换为yt-dlp进度字典，缺失字段（NA）记为None"""
+        values = line[len(_PROGRESS_PREFIX):].rstrip('\n').split('|')
+        progress = {'status': 'downloading'}
+        for field, value in zip(_PROGRESS_FIELDS, values):
+            try:
+                progress[field] = float(value)
+            except ValueError:
+                progress[field] = None
+        return progress
+    
     def _create_progress_hook(self, progress_callback: Callable[[str, float], None]):
         """创建进度回调钩子"""
         def progress_hook(d):
             if d['status'] == 'downloading':
-                if 'total_bytes' in d and d['total_bytes']:
-                    progress = (d['downloaded_bytes'] / d['total_bytes']) * 100
-                elif '_percent_str' in d:
-                    # 从百分比字符串中提取数字
-                    percent_str = d['_percent_str'].strip().rstrip('%')
-                    try:
-                        progress = float(percent_str)
-                    except ValueError:
-                        progress = 0
-                else:
-                    progress = 0
+                # 直接使用数值字段，避免解析yt-dlp格式化后的 _*_str 字符串
+                downloaded = d.get('downloaded_bytes') or 0
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                progress = downloaded * 100.0 / total if total else 0
                 
-                speed = d.get('_speed_str', '')
-                eta = d.get('_eta_str', '')
-                status = f"下载中... {speed} ETA: {eta}"
+                speed = d.get('speed')
+                eta = d.get('eta')
+                speed_text = f"{speed / 1e6:.1f} MB/s" if speed else "-- MB/s"
+                eta_text = f"{int(eta)}s" if eta is not None else "--"
+                status = f"下载中... {speed_text} ETA: {eta_text}"
                 progress_callback(status, progress)
             elif d['status'] == 'finished':
                 progress_callback("下载完成，正在处理...", 95)
@@ -397,105 +590,116 @@ B站视频下载器
     
     def _sanitize_filename(self, filename: str) -> str:
         """清理文件名，移除不安全字符"""
-        # 移除或替换不安全的字符
-        unsafe_chars = '<>:"/\\|?*'
-        for char in unsafe_chars:
-            filename = filename.replace(char, '_')
-        
-        # 限制文件名长度
-        if len(filename) > 100:
-            filename = filename[:100]
-        
-        return filename.strip()
+        # 一次性替换不安全的字符，并限制文件名长度
+        # 大多数标题不含不安全字符，直接跳过替换
+        if not _UNSAFE_FILENAME_CHARS.isdisjoint(filename):
+            filename = filename.translate(_UNSAFE_FILENAME_TABLE)
+        return filename[:100].strip()
     
-    def _find_downloaded_video(self, title: str) -> Optional[Path]:
-        """查找下载的视频文件"""
-        possible_extensions = ['.mp4', '.mkv', '.webm', '.flv']
-        
-        for ext in possible_extensions:
-            video_path = self.download_dir / f"{title}{ext}"
-            if video_path.exists():
-                return video_path
-        
-        # 如果精确匹配失败，尝试模糊匹配
-        for file_path in self.download_dir.glob(f"{title}*"):
-            if file_path.suffix.lower() in possible_extensions:
-                return file_path
+    def _scan_downloads(self, title: str) -> Tuple[Optional[Path], Optional[Path]]:
+        """
+        单次扫描下载目录，查找与标题匹配的视频和字幕文件
         
-        return None
+        Args:
+            title: 清理后的视频标题（文件名前缀）
+            
+        Returns:
+            (视频文件路径, 字幕文件路径)，未找到时对应项为None
+        """
+        video_path = None
+        video_rank = None
+        subtitle_names: List[str] = []
+        
+        with os.scandir(self.download_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if not name.startswith(title) or not entry.is_file():
+                    continue
+                
+                suffix = os.path.splitext(name)[1].lower()
+                if suffix in _VIDEO_EXTENSIONS:
+                    # 精确匹配优先于模糊匹配，其次按扩展名优先级
+                    rank = (name != title + suffix, _VIDEO_EXTENSIONS.index(suffix))
+                    if video_rank is None or rank < video_rank:
+                        video_path = Path(entry.path)
+                        video_rank = rank
+                elif suffix == '.srt':
+                    subtitle_names.append(name)
+        
+        return video_path, self._resolve_subtitle(title, subtitle_names)
     
-    def _find_downloaded_subtitle(self, title: str) -> Optional[Path]:
-        """查找下载的字幕文件 - 简化版本，专注AI字幕"""
+    def _resolve_subtitle(self, title: str, subtitle_names: List[str]) -> Optional[Path]:
+        """从扫描到的字幕文件中选出结果 - 简化版本，专注AI字幕"""
         logger.info(f"正在查找字幕文件，标题: {title}")
         
+        ai_name = f"{title}.ai-zh.srt"
+        standard_name = f"{title}.srt"
+        
         # 首先检查AI字幕文件
-        ai_subtitle_path = self.download_dir / f"{title}.ai-zh.srt"
-        if ai_subtitle_path.exists():
+        if ai_name in subtitle_names:
+            ai_subtitle_path = self.download_dir / ai_name
             # 重命名为标准格式
-            standard_path = self.download_dir / f"{title}.srt"
-            if not standard_path.exists():
-                ai_subtitle_path.rename(standard_path)
-                logger.info(f"重命名AI字幕文件: {title}.ai-zh.srt -> {title}.srt")
+            if standard_name not in subtitle_names:
+                standard_path = self.download_dir / standard_name
+                # replace在各平台上都是原子操作，扫描后目标若被创建也会直接覆盖
+                ai_subtitle_path.replace(standard_path)
+                logger.info(f"重命名AI字幕文件: {ai_name} -> {standard_name}")
                 return standard_path
             return ai_subtitle_path
         
         # 检查是否已经是标准格式
-        standard_path = self.download_dir / f"{title}.srt"
-        if standard_path.exists():
-            logger.info(f"找到标准字幕文件: {title}.srt")
-            return standard_path
+        if standard_name in subtitle_names:
+            logger.info(f"找到标准字幕文件: {standard_name}")
+            return self.download_dir / standard_name
         
         # 模糊匹配字幕文件
-        for file_path in self.download_dir.glob(f"{title}*.srt"):
-            logger.info(f"找到字幕文件: {file_path.name}")
-            return file_path
+        if subtitle_names:
+            logger.info(f"找到字幕文件: {subtitle_names[0]}")
+            return self.download_dir / subtitle_names[0]
         
         logger.warning(f"未找到字幕文件，标题: {title}")
         return None
     
+    def _find_downloaded_video(self, title: str) -> Optional[Path]:
+        """查找下载的视频文件"""
+        return self._scan_downloads(title)[0]
+    
+    def _find_downloaded_subtitle(self, title: str) -> Optional[Path]:
+        """查找下载的字幕文件"""
+        return self._scan_downloads(title)[1]
+    
     def _convert_vtt_to_srt(self, vtt_path: Path, srt_path: Path):
         """将VTT字幕文件转换为SRT格式"""
         try:
-            with open(vtt_path, 'r', encoding='utf-8') as vtt_file:
-                vtt_content = vtt_file.read()
-            
-            # 简单的VTT到SRT转换
-            lines = vtt_content.split('\n')
-            srt_lines = []
-            subtitle_count = 1
-            
-            i = 0
-            while i < len(lines):
-                line = lines[i].strip()
-                
-                # 跳过VTT头部信息
-                if line.startswith('WEBVTT') or line.startswith('NOTE') or not line:
-                    i += 1
-                    continue
+            # 逐行流式转换，直接写入SRT文件，不在内存中保留整个字幕
+            with open(vtt_path, 'r', encoding='utf-8') as vtt_file, \
+                    open(srt_path, 'w', encoding='utf-8') as srt_file:
+                subtitle_count = 0
+                in_text = False
                 
-                # 查找时间戳行
-                if '-->' in line:
-                    # 转换时间格式 (VTT使用点，SRT使用逗号)
-                    time_line = line.replace('.', ',')
-                    srt_lines.append(str(subtitle_count))
-                    srt_lines.append(time_line)
+                for raw_line in vtt_file:
+                    line = raw_line.strip()
                     
-                    # 获取字幕文本
-                    i += 1
-                    subtitle_text = []
-                    while i < len(lines) and lines[i].strip():
-                        subtitle_text.append(lines[i].strip())
-                        i += 1
+                    # 读取字幕文本，遇到空行结束当前字幕块
+                    if in_text:
+                        if line:
+                            srt_file.write(f"{line}\n")
+                        else:
+                            in_text = False
+                        continue
                     
-                    srt_lines.extend(subtitle_text)
-                    srt_lines.append('')  # 空行分隔
-                    subtitle_count += 1
-                
-                i += 1
-            
-            # 写入SRT文件
-            with open(srt_path, 'w', encoding='utf-8') as srt_file:
-                srt_file.write('\n'.join(srt_lines))
+                    # 跳过VTT头部信息
+                    if not line or line.startswith(('WEBVTT', 'NOTE')):
+                        continue
+                    
+                    # 查找时间戳行
+                    if '-->' in line:
+                        subtitle_count += 1
+                        if subtitle_count > 1:
+                            srt_file.write('\n')  # 空行分隔
+                        # 转换时间格式 (VTT使用点，SRT使用逗号)
+                        srt_file.write(f"{subtitle_count}\n{line.translate(_VTT_TO_SRT_TIME_TABLE)}\n")
+                        in_text = True
                 
         except Exception as e:
             logger.error(f"VTT转SRT转换失败: {e}")
@@ -504,10 +708,14 @@ B站视频下载器
     def cleanup_temp_files(self, title: str):
         """清理临时文件"""
         try:
-            # 清理可能的临时文件
-            for pattern in [f"{title}*.part", f"{title}*.tmp", f"{title}*.ytdl"]:
-                for temp_file in self.download_dir.glob(pattern):
-                    temp_file.unlink(missing_ok=True)
+            # 单次扫描目录清理可能的临时文件（标题中的 [ ] 等字符也不会被当作通配符）
+            with os.scandir(self.download_dir) as entries:
+                temp_files = [
+                    entry.path for entry in entries
+                    if entry.name.startswith(title) and entry.name.endswith(_TEMP_FILE_SUFFIXES)
+                ]
+            for temp_file in temp_files:
+                Path(temp_file).unlink(missing_ok=True)
         except Exception as e:
             logger.warning(f"清理临时文件失败: {e}")
 
@@ -567,7 +775,10 @@ async def download_bilibili_video(
         包含video_path和subtitle_path的字典
     """
     downloader = BilibiliDownloader(download_dir, browser, settings)
-    return await downloader.download_video_and_subtitle(url, progress_callback)
+    try:
+        return await downloader.download_video_and_subtitle(url, progress_callback)
+    finally:
+        downloader.close()
 
 async def get_bilibili_video_info(url: str, browser: Optional[str] = None, settings: Optional[Dict[str, Any]] = None) -> BilibiliVideoInfo:
     """
@@ -582,4 +793,7 @@ async def get_bilibili_video_info(url: str, browser: Optional[str] = None, setti
         视频信息对象
     """
     downloader = BilibiliDownloader(browser=browser, settings=settings)
-    return await downloader.get_video_info(url)
\ No newline at end of file
+    try:
+        return await downloader.get_video_info(url)
+    finally:
+        downloader.close()
\ No newline at end of file
@@ -2,8 +2,11 @@
 分层错误处理系统 - 提供统一的错误处理、重试机制和熔断器
 """
 import logging
+import random
+import threading
 import time
 import functools
+from collections import Counter, deque
 from typing import Type, Callable, Any, Optional, Dict, List
 from enum import Enum
 from dataclasses import dataclass
@@ -32,25 +35,32 @@ class ErrorCategory(Enum):
 class AutoClipsException(Exception):
     """自动切片工具基础异常类"""
     
+    # 固定属性使用槽位存储，错误日志中大量保留异常实例时节省内存
+    __slots__ = ('message', 'category', 'level', 'details', 'original_exception', 'timestamp',
+                 '_category_value', '_level_value')
+    
     def __init__(self, message: str, category: ErrorCategory, level: ErrorLevel = ErrorLevel.ERROR, 
                  details: Optional[Dict[str, Any]] = None, original_exception: Optional[Exception] = None):
         super().__init__(message)
         self.message = message
         self.category = category
         self.level = level
+        # 缓存枚举值字符串，避免日志和序列化时重复经过Enum描述符
+        self._category_value = category.value
+        self._level_value = level.value
         self.details = details or {}
         self.original_exception = original_exception
         self.timestamp = time.time()
     
     def __str__(self):
-        return f"[{self.category.value}] {self.message}"
+        return f"[{self._category_value}] {self.message}"
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典格式"""
         return {
             "message": self.message,
-            "category": self.category.value,
-            "level": self.level.value,
+            "category": self._category_value,
+            "level": self._level_value,
             "details": self.details,
             "timestamp": self.timestamp,
             "original_exception": str(self.original_exception) if self.original_exception else None
@@ -58,16 +68,22 @@ class AutoClipsException(Exception):
 
 class ConfigurationError(AutoClipsException):
     """配置错误"""
+    __slots__ = ()
+    
     def __init__(self, message: str, details: Optional[Dict[str, Any]] = None):
         super().__init__(message, ErrorCategory.CONFIGURATION, ErrorLevel.ERROR, details)
 
 class NetworkError(AutoClipsException):
     """网络错误"""
+    __slots__ = ()
+    
     def __init__(self, message: str, details: Optional[Dict[str, Any]] = None, original_exception: Optional[Exception] = None):
         super().__init__(message, ErrorCategory.NETWORK, ErrorLevel.ERROR, details, original_exception)
 
 class APIError(AutoClipsException):
     """API调用错误"""
+    __slots__ = ()
+    
     def __init__(self, message: str, status_code: Optional[int] = None, details: Optional[Dict[str, Any]] = None):
         api_details = details or {}
         if status_code:
@@ -76,6 +92,8 @@ class APIError(AutoClipsException):
 
 class FileIOError(AutoClipsException):
     """文件IO错误"""
+    __slots__ = ()
+    
     def __init__(self, message: str, file_path: Optional[str] = None, details: Optional[Dict[str, Any]] = None):
         file_details = details or {}
         if file_path:
@@ -84,6 +102,8 @@ class FileIOError(AutoClipsException):
 
 class ProcessingError(AutoClipsException):
     """处理错误"""
+    __slots__ = ()
+    
     def __init__(self, message: str, step: Optional[str] = None, details: Optional[Dict[str, Any]] = None):
         processing_details = details or {}
         if step:
@@ -92,12 +112,61 @@ class ProcessingError(AutoClipsException):
 
 class ValidationError(AutoClipsException):
     """验证错误"""
+    __slots__ = ()
+    
     def __init__(self, message: str, field: Optional[str] = None, details: Optional[Dict[str, Any]] = None):
         validation_details = details or {}
         if field:
             validation_details["field"] = field
         super().__init__(message, ErrorCategory.VALIDATION, ErrorLevel.WARNING, validation_details)
 
+class TokenBucket:
+    """
+    线程安全的令牌桶
+    
+    用作全局重试预算：所有被装饰函数的重试共享同一个桶，
+    部分故障时限制整体重试速率，避免重试风暴放大故障；
+    也用作LLM请求的主动限流（acquire），把请求速率控制在服务商的QPS限制以内。
+    """
+    
+    def __init__(self, capacity: float, refill_per_sec: float):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self):
+        """按经过的时间补充令牌，调用方需持有锁"""
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_sec)
+            self.last_refill = now
+    
+    def try_consume(self, tokens: float = 1) -> bool:
+        """尝试取出令牌，令牌不足时返回False"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+    
+    def acquire(self, tokens: float = 1):
+        """取出令牌，令牌不足时等待到足够为止"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.refill_per_sec
+            time.sleep(wait)
+
+# 全局重试预算：最多积累100次重试，每秒恢复10次
+_retry_bucket = TokenBucket(capacity=100, refill_per_sec=10)
+
 @dataclass
 class RetryConfig:
     """重试配置"""
@@ -106,6 +175,10 @@ class RetryConfig:
     max_delay: float = 60.0
     exponential_base: float = 2.0
     retryable_exceptions: List[Type[Exception]] = None
+    # 退避抖动策略：decorrelated（默认）、full、equal、none（不加抖动的固定指数退避）
+    jitter: str = "decorrelated"
+    # 重试预算令牌桶，为None时使用全局共享的_retry_bucket；预算耗尽时直接抛出异常不再重试
+    retry_budget: Optional[TokenBucket] = None
     
     def __post_init__(self):
         if self.retryable_exceptions is None:
@@ -116,6 +189,31 @@ class RetryConfig:
                 TimeoutError,
                 OSError
             ]
+        # except子句需要元组，预先构建避免每次失败时重新转换
+        self._retryable_tuple = tuple(self.retryable_exceptions)
+    
+    def compute_delay(self, attempt: int, prev_delay: float) -> float:
+        """
+        计算第attempt次重试前的等待时间
+        
+        多个调用方同时失败时，固定的指数退避会让它们在同一时刻重试；
+        加入随机抖动可以把重试分散开，减轻对上游服务的冲击。
+        
+        Args:
+            attempt: 已失败的次数（从0开始）
+            prev_delay: 上一次的等待时间，首次为base_delay
+            
+        Returns:
+            等待秒数
+        """
+        exp_delay = min(self.base_delay * (self.exponential_base ** attempt), self.max_delay)
+        if self.jitter == "decorrelated":
+            return min(self.max_delay, random.uniform(self.base_delay, prev_delay * 3))
+        if self.jitter == "full":
+            return random.uniform(0, exp_delay)
+        if self.jitter == "equal":
+            return exp_delay / 2 + random.uniform(0, exp_delay / 2)
+        return exp_delay
 
 class CircuitBreaker:
     """熔断器实现"""
@@ -126,13 +224,22 @@ class CircuitBreaker:
         self.recovery_timeout = recovery_timeout
         self.expected_exception = expected_exception
         self.failure_count = 0
+        # 使用单调时钟，避免系统时间回拨导致状态误判
         self.last_failure_time = 0
         self.state = "CLOSED"  # CLOSED, OPEN, HALF_OPEN
+        # 半开探测失败后恢复等待时间按指数增长，避免下游持续故障时频繁探测
+        self.consecutive_open_cycles = 0
+        self.max_recovery_timeout = recovery_timeout * 16
+    
+    @property
+    def effective_recovery_timeout(self) -> float:
+        """当前开启状态需要等待的恢复时间"""
+        return min(self.recovery_timeout * (2 ** self.consecutive_open_cycles), self.max_recovery_timeout)
     
     def call(self, func: Callable, *args, **kwargs) -> Any:
         """执行函数，应用熔断器逻辑"""
         if self.state == "OPEN":
-            if time.time() - self.last_failure_time > self.recovery_timeout:
+            if time.monotonic() - self.last_failure_time > self.effective_recovery_timeout:
                 self.state = "HALF_OPEN"
             else:
                 raise AutoClipsException(
@@ -146,18 +253,21 @@ class CircuitBreaker:
             if self.state == "HALF_OPEN":
                 self.state = "CLOSED"
                 self.failure_count = 0
+                self.consecutive_open_cycles = 0
             return result
         except self.expected_exception as e:
             self.failure_count += 1
-            self.last_failure_time = time.time()
+            self.last_failure_time = time.monotonic()
             
             if self.failure_count >= self.failure_threshold:
+                if self.state == "HALF_OPEN":
+                    self.consecutive_open_cycles += 1
                 self.state = "OPEN"
             
             raise e
 
 def retry_with_backoff(config: Optional[RetryConfig] = None):
-    """重试装饰器，支持指数退避"""
+    """重试装饰器，支持带随机抖动的指数退避"""
     if config is None:
         config = RetryConfig()
     
@@ -165,24 +275,28 @@ def retry_with_backoff(config: Optional[RetryConfig] = None):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             last_exception = None
+            delay = config.base_delay
             
             for attempt in range(config.max_retries + 1):
                 try:
                     return func(*args, **kwargs)
-                except tuple(config.retryable_exceptions) as e:
+                except config._retryable_tuple as e:
                     last_exception = e
                     
                     if attempt == config.max_retries:
-                        logger.error(f"函数 {func.__name__} 在 {config.max_retries} 次重试后失败: {e}")
+                        logger.error("函数 %s 在 %d 次重试后失败: %s", func.__name__, config.max_retries, e)
+                        raise e
+                    
+                    # 全局重试预算耗尽时快速失败，不再加重下游负担
+                    budget = config.retry_budget or _retry_bucket
+                    if not budget.try_consume(1):
+                        logger.warning("函数 %s 重试预算已耗尽，放弃重试: %s", func.__name__, e)
                         raise e
                     
-                    # 计算延迟时间
-                    delay = min(
-                        config.base_delay * (config.exponential_base ** attempt),
-                        config.max_delay
-                    )
+                    # 计算延迟时间（带随机抖动）
+                    delay = config.compute_delay(attempt, delay)
                     
-                    logger.warning(f"函数 {func.__name__} 第 {attempt + 1} 次尝试失败，{delay}秒后重试: {e}")
+                    logger.warning("函数 %s 第 %d 次尝试失败，%.2f秒后重试: %s", func.__name__, attempt + 1, delay, e)
                     time.sleep(delay)
             
             if last_exception:
@@ -221,26 +335,32 @@ def error_context(category: ErrorCategory, context_info: Optional[Dict[str, Any]
 class ErrorHandler:
     """错误处理器"""
     
-    def __init__(self):
-        self.error_log: List[AutoClipsException] = []
+    # 错误级别到日志方法名的映射
+    _LEVEL_DISPATCH = {
+        ErrorLevel.DEBUG: "debug",
+        ErrorLevel.INFO: "info",
+        ErrorLevel.WARNING: "warning",
+        ErrorLevel.ERROR: "error",
+        ErrorLevel.CRITICAL: "critical",
+    }
+    
+    def __init__(self, max_log_size: int = 10_000):
+        # 有界日志，错误风暴下内存保持恒定
+        self.error_log: deque = deque(maxlen=max_log_size)
+        # 分类计数增量维护，摘要无需遍历日志
+        self._category_counts: Counter = Counter()
+        self._total_errors = 0
         self.circuit_breakers: Dict[str, CircuitBreaker] = {}
     
     def handle_error(self, error: AutoClipsException, context: Optional[str] = None):
         """处理错误"""
         # 记录错误
         self.error_log.append(error)
+        self._category_counts[error._category_value] += 1
+        self._total_errors += 1
         
-        # 根据错误级别记录日志
-        if error.level == ErrorLevel.DEBUG:
-            logger.debug(f"[{context}] {error}")
-        elif error.level == ErrorLevel.INFO:
-            logger.info(f"[{context}] {error}")
-        elif error.level == ErrorLevel.WARNING:
-            logger.warning(f"[{context}] {error}")
-        elif error.level == ErrorLevel.ERROR:
-            logger.error(f"[{context}] {error}")
-        elif error.level == ErrorLevel.CRITICAL:
-            logger.critical(f"[{context}] {error}")
+        # 根据错误级别记录日志（使用%s参数，级别未开启时跳过格式化）
+        getattr(logger, self._LEVEL_DISPATCH[error.level])("[%s] %s", context, error)
         
         # 根据错误分类进行特殊处理
         if error.category == ErrorCategory.API and isinstance(error, APIError):
@@ -279,20 +399,17 @@ class ErrorHandler:
         if not self.error_log:
             return {"total_errors": 0}
         
-        error_counts = {}
-        for error in self.error_log:
-            category = error.category.value
-            error_counts[category] = error_counts.get(category, 0) + 1
-        
         return {
-            "total_errors": len(self.error_log),
-            "error_counts": error_counts,
+            "total_errors": self._total_errors,
+            "error_counts": dict(self._category_counts),
             "latest_error": self.error_log[-1].to_dict() if self.error_log else None
         }
     
     def clear_error_log(self):
         """清空错误日志"""
         self.error_log.clear()
+        self._category_counts.clear()
+        self._total_errors = 0
 
 # 全局错误处理器实例
 error_handler = ErrorHandler()
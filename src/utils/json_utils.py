@@ -3,76 +3,185 @@ JSON工具类 - 提供统一的JSON解析和修复功能
 """
 import json
 import logging
+import os
 import re
 import tempfile
-from typing import Any
+from typing import Any, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+
+def _loads(s: str) -> Any:
+    """解析JSON，优先使用orjson；orjson不接受的输入（如NaN）交给标准库处理，保持原有语义"""
+    if orjson is not None:
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(s)
+
+
+_DECODER = json.JSONDecoder()
+
+def _extract_json(s: str) -> Any:
+    """
+    从第一个 { 或 [ 处解析出一个完整的JSON值，忽略其后的多余文本
+    
+    JSONDecoder.raw_decode在C扫描器中完成，不需要贪婪正则先找到最后一个括号再回溯。
+    找不到括号、该处不是合法JSON，或其后还有其他JSON结构（如多个对象直接拼接，只取第一个会丢数据）时，
+    抛出json.JSONDecodeError交给后续的修复流程
+    """
+    starts = [i for i in (s.find('{'), s.find('[')) if i >= 0]
+    if not starts:
+        raise json.JSONDecodeError("未找到JSON结构", s, 0)
+    result, end = _DECODER.raw_decode(s, min(starts))
+    if '{' in s[end:] or '[' in s[end:]:
+        raise json.JSONDecodeError("JSON之后还有其他JSON结构", s, end)
+    return result
+
+def _fix_adjacent(match: re.Match) -> str:
+    """在相邻的对象或数组之间补上逗号"""
+    return '},{' if match.group()[0] == '}' else '],['
+
+
+def _fix_nl_or_esc_quote(match: re.Match) -> str:
+    """多余空行压缩为单个换行，双反斜杠转义的引号还原为单层转义"""
+    return '\n' if match.group()[0] == '\n' else '\\"'
+
+
+# 解析失败时保存原始响应用于调试：需设置 AUTOCLIP_DEBUG_DUMP=1 开启，
+# 单个文件最多64KB，每个进程最多保存10个，避免失败高峰时阻塞请求或占满/tmp
+_DUMP_MAX_BYTES = 64 * 1024
+_DUMP_LIMIT = 10
+_DUMP_COUNTER = 0
+
+
+def _dump_failed_response(response: str) -> None:
+    """按需保存解析失败的响应前64KB"""
+    global _DUMP_COUNTER
+    if os.getenv("AUTOCLIP_DEBUG_DUMP") != "1" or _DUMP_COUNTER >= _DUMP_LIMIT:
+        return
+    _DUMP_COUNTER += 1
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as f:
+        f.write(response[:_DUMP_MAX_BYTES])
+        logger.error("💾 [调试信息] 原始响应前64KB已保存到 %s 以便调试", f.name)
+
+
+def _bracket_counts(s: str) -> Tuple[int, int, int, int]:
+    """
+    统计 { } [ ] 的数量
+    
+    str.count是C实现的单字符扫描，四次调用仍比collections.Counter或逐字符循环快一个数量级
+    """
+    return s.count('{'), s.count('}'), s.count('['), s.count(']')
+
+def _swap_quotes(s: str) -> str:
+    """
+    将双引号字符串之外的单引号换成双引号
+    
+    按双引号字符串（识别反斜杠转义）切分，只替换字符串之外的片段，字符串内的撇号保持不变。
+    re.split的结果中偶数位是字符串之外的片段，奇数位是字符串本身
+    """
+    if "'" not in s:
+        return s
+    parts = _RE_DQ_STR.split(s)
+    parts[::2] = [part.replace("'", '"') for part in parts[::2]]
+    return ''.join(parts)
+
+# 需要删除的控制字符（保留\t、\n、\r），用str.translate一次删除
+# 同时删除BOM（U+FEFF），与控制字符在同一次translate中完成
+_CTRL_DELETE_TABLE = dict.fromkeys([*range(0x00, 0x09), 0x0b, 0x0c, *range(0x0e, 0x20), 0x7f, 0xfeff])
+
+# 正则表达式在模块加载时编译一次，避免每次解析都查找re模块的缓存
+# 相邻对象/数组之间缺少逗号：}{ 和 ][ 两种模式互不重叠，合并为一次扫描
+_RE_ADJ = re.compile(r'}\s*{|]\s*\[')
+# 多余的逗号：,} 和 ,] 合并为一次扫描
+_RE_TRAIL_COMMA = re.compile(r',\s*([}\]])')
+# 双引号字符串（含未闭合到末尾的），捕获分组使re.split保留字符串本身
+_RE_DQ_STR = re.compile(r'("[^"\\]*(?:\\.[^"\\]*)*(?:"|\\?\Z))', re.DOTALL)
+_RE_BARE_KEY = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)\s*:')
+# 多余空行和双反斜杠转义的引号，合并为一次扫描
+_RE_NL_OR_ESC_QUOTE = re.compile(r'\n\s*\n|\\\\\\"')
+_RE_CONTEN = re.compile(r'"conten"\s*:')
+_RE_CONTEN_TRUNCATED = re.compile(r'"conten\.\.\."')
+_RE_MD = re.compile(r'```(?:json)?\s*([\s\S]*?)\s*```', re.DOTALL)
+_RE_JSON_ANY = re.compile(r'\[[\s\S]*\]|\{[\s\S]*\}', re.DOTALL)
+# 首个非空白字符为 [ 或 { 的行
+_RE_JSON_LINE_START = re.compile(r'^[^\S\n]*[\[{]', re.MULTILINE)
+
 class JSONUtils:
     """JSON工具类"""
     
+    @staticmethod
+    def dumps(data: Any, indent: bool = False) -> str:
+        """
+        序列化为JSON字符串（保留非ASCII字符），优先使用orjson
+        
+        orjson不支持的输入（如非字符串键、超大整数）交给标准库处理
+        """
+        if orjson is not None:
+            try:
+                return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0).decode('utf-8')
+            except orjson.JSONEncodeError:
+                pass
+        return json.dumps(data, ensure_ascii=False, indent=2 if indent else None)
+    
     @staticmethod
     def sanitize_string(s: str) -> str:
         """增强的净化函数，移除可能导致JSON解析失败的字符"""
-        # 移除BOM标记
-        s = s.lstrip('\ufeff')
-        # 移除前后空白符
-        s = s.strip()
-        # 移除可能的控制字符（保留必要的换行和制表符）
-        s = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]', '', s)
-        return s
+        # 一次translate移除BOM标记和可能的控制字符（保留必要的换行和制表符），再移除前后空白符
+        return s.translate(_CTRL_DELETE_TABLE).strip()
     
     @staticmethod
     def fix_common_json_errors(json_str: str) -> str:
         """修复常见的JSON格式错误"""
+        # 已经是合法JSON时直接返回，省去下面的多次正则替换和全文扫描
+        try:
+            _loads(json_str)
+            return json_str
+        except json.JSONDecodeError:
+            pass
+        
         # 记录原始字符串用于调试
         original_str = json_str
         
-        # 1. 修复缺少逗号的问题
-        json_str = re.sub(r'}\s*{', '},{', json_str)
-        json_str = re.sub(r']\s*\[', '],[', json_str)
-        
-        # 2. 修复对象之间缺少逗号的问题（更精确的模式）
-        json_str = re.sub(r'}\s*\n\s*{', '},\n{', json_str)
+        # 1. 修复缺少逗号的问题（}\n{ 已被 }\s*{ 覆盖）
+        json_str = _RE_ADJ.sub(_fix_adjacent, json_str)
         
-        # 3. 修复多余的逗号
-        json_str = re.sub(r',\s*}', '}', json_str)
-        json_str = re.sub(r',\s*]', ']', json_str)
+        # 2. 修复多余的逗号
+        json_str = _RE_TRAIL_COMMA.sub(r'\1', json_str)
         
-        # 4. 修复单引号为双引号
-        json_str = re.sub(r"'([^']*?)'\s*:", r'"\1":', json_str)
-        json_str = re.sub(r":\s*'([^']*?)'", r': "\1"', json_str)
+        # 3. 修复单引号为双引号
+        json_str = _swap_quotes(json_str)
         
-        # 5. 修复字段名没有引号的问题
-        json_str = re.sub(r'([a-zA-Z_][a-zA-Z0-9_]*)\s*:', r'"\1":', json_str)
+        # 4. 修复字段名没有引号的问题
+        json_str = _RE_BARE_KEY.sub(r'"\1":', json_str)
         
-        # 6. 修复可能的换行符问题
-        json_str = re.sub(r'\n\s*\n', '\n', json_str)
+        # 5. 修复可能的换行符问题，以及双反斜杠转义的引号问题 (\\\" -> \")
+        json_str = _RE_NL_OR_ESC_QUOTE.sub(_fix_nl_or_esc_quote, json_str)
         
-        # 7. 修复双反斜杠转义的引号问题 (\\\" -> \")
-        json_str = re.sub(r'\\\\\\"', r'\\"', json_str)
+        # 6. 修复字段名拼写错误（如conten -> content）
+        json_str = _RE_CONTEN.sub(r'"content":', json_str)
         
-        # 8. 修复字段名拼写错误（如conten -> content）
-        json_str = re.sub(r'"conten"\s*:', r'"content":', json_str)
-        
-        # 9. 确保数组和对象的正确闭合
+        # 7. 确保数组和对象的正确闭合
         # 统计括号和方括号的数量
-        open_braces = json_str.count('{')
-        close_braces = json_str.count('}')
-        open_brackets = json_str.count('[')
-        close_brackets = json_str.count(']')
+        open_braces, close_braces, open_brackets, close_brackets = _bracket_counts(json_str)
         
-        # 如果括号不匹配，尝试修复
-        if open_braces > close_braces:
-            json_str += '}' * (open_braces - close_braces)
-        if open_brackets > close_brackets:
-            json_str += ']' * (open_brackets - close_brackets)
+        # 如果括号不匹配，尝试修复（一次拼接，避免大字符串被复制两次）
+        missing_braces = max(0, open_braces - close_braces)
+        missing_brackets = max(0, open_brackets - close_brackets)
+        if missing_braces or missing_brackets:
+            json_str = f"{json_str}{'}' * missing_braces}{']' * missing_brackets}"
         
         # 记录修复过程
         if json_str != original_str:
-            logger.debug(f"JSON修复前: {original_str[:100]}...")
-            logger.debug(f"JSON修复后: {json_str[:100]}...")
+            logger.debug("JSON修复前: %s...", original_str[:100])
+            logger.debug("JSON修复后: %s...", json_str[:100])
         
         return json_str
     
@@ -88,7 +197,7 @@ class JSONUtils:
             
         # 尝试修复常见的截断问题
         # 修复字段名拼写错误（如conten... -> content）
-        json_str = re.sub(r'"conten\.\.\."', r'"content"', json_str)
+        json_str = _RE_CONTEN_TRUNCATED.sub(r'"content"', json_str)
         
         # 修复未闭合的字符串
         if json_str.count('"') % 2 == 1:  # 奇数个引号，说明有一个未闭合
@@ -102,16 +211,13 @@ class JSONUtils:
                     json_str = json_str[:last_quote+1] + '"' + json_str[last_quote+1:]
         
         # 尝试补全JSON结构
-        open_braces = json_str.count('{')
-        close_braces = json_str.count('}')
-        open_brackets = json_str.count('[')
-        close_brackets = json_str.count(']')
+        open_braces, close_braces, open_brackets, close_brackets = _bracket_counts(json_str)
         
         # 补全缺失的闭合符号
-        if open_braces > close_braces:
-            json_str += '}' * (open_braces - close_braces)
-        if open_brackets > close_brackets:
-            json_str += ']' * (open_brackets - close_brackets)
+        missing_braces = max(0, open_braces - close_braces)
+        missing_brackets = max(0, open_brackets - close_brackets)
+        if missing_braces or missing_brackets:
+            json_str = f"{json_str}{'}' * missing_braces}{']' * missing_brackets}"
             
         # 确保以闭合符号结尾
         if json_str and json_str[-1] not in ['}', ']']:
@@ -129,25 +235,17 @@ class JSONUtils:
     @staticmethod
     def preprocess_llm_response(response: str) -> str:
         """预处理LLM响应，移除常见的非JSON内容"""
-        # 移除开头的标题和说明文字
-        lines = response.split('\n')
-        json_start = -1
-        
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            if stripped.startswith('[') or stripped.startswith('{'):
-                json_start = i
-                break
-        
-        if json_start >= 0:
-            response = '\n'.join(lines[json_start:])
+        # 移除开头的标题和说明文字（直接定位JSON起始行，不再逐行拆分）
+        if '[' in response or '{' in response:
+            match = _RE_JSON_LINE_START.search(response)
+            if match:
+                response = response[match.start():]
         
         # 移除末尾的非JSON内容
-        if '```' in response:
-            # 如果有多个```，取第一个之前的内容
-            parts = response.split('```')
-            if len(parts) > 1:
-                response = parts[0]
+        # 如果有多个```，取第一个之前的内容（直接定位，不拆分整个字符串）
+        fence = response.find('```')
+        if fence >= 0:
+            response = response[:fence]
         
         return response.strip()
     
@@ -164,33 +262,63 @@ class JSONUtils:
         6. 对于被截断的JSON，尝试修复后再解析。
         """
         
-        logger.info(f"🔍 [JSON解析开始] 原始响应长度: {len(response)} 字符")
-        logger.debug(f"📄 [原始响应前300字符]: {response[:300]}...")
+        logger.info("🔍 [JSON解析开始] 原始响应长度: %s 字符", len(response))
+        logger.debug("📄 [原始响应前300字符]: %s...", response[:300])
         
         response = response.strip()
         
+        # 快速路径：以 { 或 [ 开头时多数是干净的JSON，直接解析一次，成功则跳过预处理。
+        # 不再要求不含```：合法JSON的字符串值中可能出现代码块标记，整体解析成功即是正确结果
+        if response[:1] in ('{', '['):
+            try:
+                result = _loads(response)
+                logger.info("✅ [快速路径成功] 直接解析JSON成功")
+                return result
+            except json.JSONDecodeError:
+                pass
+        
+        # 快速路径：整个响应是一个Markdown代码块时，直接解析代码块内容
+        if response.startswith('```'):
+            end = response.rfind('```')
+            if end > 3:
+                inner = response[response.find('\n', 3) + 1:end].strip()
+                # 内容需以 { 或 [ 开头且不含```，否则交给下面的完整流程以保持原有结果
+                if inner[:1] in ('{', '[') and '```' not in inner:
+                    try:
+                        result = _loads(inner)
+                        logger.info("✅ [快速路径成功] Markdown代码块直接解析成功")
+                        return result
+                    except json.JSONDecodeError:
+                        pass
+        
         # 0. 预处理响应，移除非JSON内容
         response = JSONUtils.preprocess_llm_response(response)
-        logger.info(f"🧹 [预处理完成] 处理后长度: {len(response)} 字符")
-        logger.debug(f"📄 [预处理后内容前200字符]: {response[:200]}...")
+        logger.info("🧹 [预处理完成] 处理后长度: %s 字符", len(response))
+        logger.debug("📄 [预处理后内容前200字符]: %s...", response[:200])
         
         # 特殊处理被截断的JSON（以...结尾的情况）
         if response.endswith('...') and (response.startswith('[') or response.startswith('{')):
             logger.info("🔍 [检测到被截断的JSON] 尝试修复...")
             response = JSONUtils.fix_truncated_json(response)
-            logger.info(f"🔧 [修复后长度]: {len(response)} 字符")
-            logger.debug(f"📄 [修复后内容]: {response[:200]}...")
+            logger.info("🔧 [修复后长度]: %s 字符", len(response))
+            logger.debug("📄 [修复后内容]: %s...", response[:200])
         
         # 1. 优先尝试从Markdown代码块中提取
-        logger.info(f"🔍 [阶段1] 尝试从Markdown代码块提取JSON...")
-        match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', response, re.DOTALL)
+        logger.info("🔍 [阶段1] 尝试从Markdown代码块提取JSON...")
+        # 先做C级子串检查，没有代码块标记时跳过正则扫描
+        match = _RE_MD.search(response) if '```' in response else None
         if match:
-            json_str = JSONUtils.sanitize_string(match.group(1))
-            logger.info(f"✅ [Markdown提取成功] JSON字符串长度: {len(json_str)}")
-            logger.debug(f"📄 [Markdown提取内容]: {json_str[:200]}...")
+            json_str = match.group(1)
+            logger.info("✅ [Markdown提取成功] JSON字符串长度: %s", len(json_str))
+            logger.debug("📄 [Markdown提取内容]: %s...", json_str[:200])
             try:
-                result = json.loads(json_str)
-                logger.info(f"✅ [阶段1成功] Markdown提取并解析JSON成功")
+                # 大多数响应本身就是合法JSON，先直接解析，失败后再净化
+                try:
+                    result = _loads(json_str)
+                except json.JSONDecodeError:
+                    json_str = JSONUtils.sanitize_string(json_str)
+                    result = _loads(json_str)
+                logger.info("✅ [阶段1成功] Markdown提取并解析JSON成功")
                 return result
             except json.JSONDecodeError as e:
                 # 记录具体的错误位置和上下文
@@ -198,62 +326,75 @@ class JSONUtils:
                 context_start = max(0, error_pos - 50)
                 context_end = min(len(json_str), error_pos + 50)
                 context = json_str[context_start:context_end]
-                logger.error(f"❌ [JSON解析失败] 位置{error_pos}，上下文: ...{context}...")
-                logger.warning(f"⚠️ [阶段1失败] 从Markdown提取的内容解析失败: {e}。将尝试修复后解析。")
+                logger.error("❌ [JSON解析失败] 位置%s，上下文: ...%s...", error_pos, context)
+                logger.warning("⚠️ [阶段1失败] 从Markdown提取的内容解析失败: %s。将尝试修复后解析。", e)
                 
                 # 尝试修复常见错误后再解析
                 try:
-                    logger.info(f"🔧 [尝试修复] 修复JSON格式错误...")
+                    logger.info("🔧 [尝试修复] 修复JSON格式错误...")
                     fixed_json = JSONUtils.fix_common_json_errors(json_str)
-                    result = json.loads(fixed_json)
-                    logger.info(f"✅ [阶段1修复成功] JSON修复后解析成功")
+                    result = _loads(fixed_json)
+                    logger.info("✅ [阶段1修复成功] JSON修复后解析成功")
                     return result
                 except json.JSONDecodeError:
-                    logger.warning(f"⚠️ [修复失败] 修复后仍然解析失败，将尝试解析整个响应。")
+                    logger.warning("⚠️ [修复失败] 修复后仍然解析失败，将尝试解析整个响应。")
         else:
-            logger.info(f"💫 [阶段1跳过] 未找到Markdown代码块")
+            logger.info("💫 [阶段1跳过] 未找到Markdown代码块")
         
         # 2. 如果没有Markdown，或Markdown解析失败，尝试整个响应
-        logger.info(f"🔍 [阶段2] 尝试直接解析整个响应...")
+        logger.info("🔍 [阶段2] 尝试直接解析整个响应...")
         try:
-            sanitized_response = JSONUtils.sanitize_string(response)
-            logger.debug(f"🧹 [净化后内容]: {sanitized_response[:200]}...")
-            result = json.loads(sanitized_response)
-            logger.info(f"✅ [阶段2成功] 直接解析整个响应成功")
+            try:
+                result = _loads(response)
+            except json.JSONDecodeError:
+                sanitized_response = JSONUtils.sanitize_string(response)
+                logger.debug("🧹 [净化后内容]: %s...", sanitized_response[:200])
+                result = _loads(sanitized_response)
+            logger.info("✅ [阶段2成功] 直接解析整个响应成功")
             return result
         except json.JSONDecodeError as e:
-            logger.warning(f"⚠️ [阶段2失败] 直接解析响应失败: {e}")
+            logger.warning("⚠️ [阶段2失败] 直接解析响应失败: %s", e)
+            
+            # 3. 如果整个响应直接解析也失败，先从第一个括号处解析一个完整的JSON值（忽略其后的说明文字），
+            #    失败后再用通用正则寻找并修复
+            logger.info("🔍 [阶段3] 从第一个括号处提取JSON...")
+            try:
+                result = _extract_json(JSONUtils.sanitize_string(response))
+                logger.info("✅ [阶段3成功] 提取并解析JSON成功")
+                return result
+            except json.JSONDecodeError:
+                pass
             
-            # 3. 如果整个响应直接解析也失败，做最后一次尝试，用通用正则寻找
-            logger.info(f"🔍 [阶段3] 使用通用正则表达式寻找JSON...")
-            json_match = re.search(r'\[[\s\S]*\]|\{[\s\S]*\}', response, re.DOTALL)
+            logger.info("🔍 [阶段3] 使用通用正则表达式寻找JSON...")
+            json_match = (
+                _RE_JSON_ANY.search(response)
+                if '[' in response or '{' in response else None
+            )
             if json_match:
                 json_str = JSONUtils.sanitize_string(json_match.group())
-                logger.info(f"✅ [正则匹配成功] 找到JSON结构，长度: {len(json_str)}")
-                logger.debug(f"📄 [正则匹配内容]: {json_str[:200]}...")
+                logger.info("✅ [正则匹配成功] 找到JSON结构，长度: %s", len(json_str))
+                logger.debug("📄 [正则匹配内容]: %s...", json_str[:200])
                 try:
-                    result = json.loads(json_str)
-                    logger.info(f"✅ [阶段3成功] 正则匹配并解析JSON成功")
+                    result = _loads(json_str)
+                    logger.info("✅ [阶段3成功] 正则匹配并解析JSON成功")
                     return result
                 except json.JSONDecodeError as e:
                     # 4. 最后尝试修复常见错误
-                    logger.warning(f"⚠️ [阶段3失败] 正则匹配内容解析失败: {e}")
+                    logger.warning("⚠️ [阶段3失败] 正则匹配内容解析失败: %s", e)
                     try:
-                        logger.info(f"🔧 [最后尝试] 修复JSON后再次解析...")
+                        logger.info("🔧 [最后尝试] 修复JSON后再次解析...")
                         fixed_json = JSONUtils.fix_common_json_errors(json_str)
-                        result = json.loads(fixed_json)
-                        logger.info(f"✅ [最终成功] JSON修复后解析成功")
+                        result = _loads(fixed_json)
+                        logger.info("✅ [最终成功] JSON修复后解析成功")
                         return result
                     except json.JSONDecodeError as final_e:
-                        logger.error(f"❌ [最终失败] 所有尝试都失败: {final_e}")
-                        # 保存原始响应以便调试
-                        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as f:
-                            f.write(response)
-                            logger.error(f"💾 [调试信息] 原始响应已保存到 {f.name} 以便调试")
+                        logger.error("❌ [最终失败] 所有尝试都失败: %s", final_e)
+                        # 保存原始响应以便调试（需显式开启）
+                        _dump_failed_response(response)
                         raise ValueError(f"无法从响应中解析出有效的JSON: {response[:200]}...") from final_e
             else:
-                logger.error(f"❌ [正则匹配失败] 未找到任何JSON结构")
+                logger.error("❌ [正则匹配失败] 未找到任何JSON结构")
             
             # 如果连通用正则都找不到，就彻底失败
-            logger.error(f"❌ [彻底失败] 所有JSON解析方法都失败")
+            logger.error("❌ [彻底失败] 所有JSON解析方法都失败")
             raise ValueError(f"无法从响应中解析出有效的JSON: {response[:200]}...")
\ No newline at end of file
@@ -0,0 +1,418 @@
+"""
+LLM响应缓存 - 对完全相同的(模型, 提示词, 输入)复用已有响应，并保持提示词前缀稳定以利用服务端前缀缓存
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    np = None
+    SentenceTransformer = None
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+from .json_utils import JSONUtils
+
+logger = logging.getLogger(__name__)
+
+# 提示词与输入数据之间的固定分隔符。服务端前缀缓存要求提示词部分逐字节一致，
+# 提示词模板中也引用了“输入内容”，不要随意修改
+PROMPT_INPUT_SEPARATOR = "\n\n输入内容：\n"
+# 前缀缓存通常要求前缀至少约1024个token
+_PREFIX_CACHE_MIN_TOKENS = 1024
+_short_prefix_warned = set()
+
+def build_llm_input(prompt: str, input_data: Any = None, compact: bool = False) -> str:
+    """
+    拼接发送给模型的完整输入
+    
+    固定的提示词在前、变化的输入数据在后，提示词去掉末尾空白后接固定分隔符，
+    保证同一模板在所有文本块的调用中前缀逐字节一致。
+    compact为True时字典输入序列化为不带缩进的紧凑JSON，减少输入token。
+    """
+    if not input_data:
+        return prompt
+    _warn_if_short_prefix(prompt)
+    if isinstance(input_data, dict):
+        payload = JSONUtils.dumps(input_data, indent=not compact)
+    else:
+        payload = str(input_data)
+    return f"{prompt.rstrip()}{PROMPT_INPUT_SEPARATOR}{payload}"
+
+def _warn_if_short_prefix(prompt: str):
+    """提示词过短、无法命中前缀缓存时记录一次提示"""
+    # 粗略按两个字符一个token估算
+    approx_tokens = len(prompt) // 2
+    if approx_tokens >= _PREFIX_CACHE_MIN_TOKENS:
+        return
+    prompt_hash = hash(prompt)
+    if prompt_hash in _short_prefix_warned:
+        return
+    _short_prefix_warned.add(prompt_hash)
+    logger.info(f"ℹ️ [前缀缓存] 提示词约{approx_tokens}个token，低于{_PREFIX_CACHE_MIN_TOKENS}，可能无法命中服务端前缀缓存")
+
+@lru_cache(maxsize=32)
+def _prefix_hasher(model: str, prompt: str):
+    """
+    已输入模型和提示词的sha256对象
+    
+    同一模板的提示词在所有文本块的调用中不变，只哈希一次，之后copy()再追加输入数据即可
+    """
+    return hashlib.sha256(f"{model}\0{prompt}\0".encode('utf-8'))
+
+class LLMResponseCache:
+    """
+    LLM响应精确匹配缓存
+    
+    内存中按LRU保留最近的响应；指定cache_dir时同时写入磁盘，进程重启后仍可命中。
+    LLM调用通常需要数秒，命中缓存可直接返回；相同请求并发时只调用一次（single_flight）。
+    """
+    
+    def __init__(self, max_entries: int = 256, cache_dir: Optional[Path] = None):
+        """
+        初始化缓存
+        
+        Args:
+            max_entries: 内存中最多保留的响应数
+            cache_dir: 磁盘缓存目录，为None时只使用内存缓存
+        """
+        self.max_entries = max_entries
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 正在进行中的请求：缓存键 -> 等待其结果的Future
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(model: str, prompt: str, input_data: Any = None) -> str:
+        """根据模型、提示词和规范化后的输入数据生成缓存键"""
+        canonical_input = json.dumps(input_data, ensure_ascii=False, sort_keys=True, default=str)
+        # 结果与对 f"{model}\0{prompt}\0{canonical_input}" 整体哈希相同，已有的磁盘缓存仍然有效
+        hasher = _prefix_hasher(model, prompt).copy()
+        hasher.update(canonical_input.encode('utf-8'))
+        return hasher.hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """查找缓存的响应，未命中返回None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+        
+        if self.cache_dir is None:
+            return None
+        try:
+            value = (self.cache_dir / f"{key}.txt").read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"读取LLM磁盘缓存失败: {e}")
+            return None
+        self._remember(key, value)
+        return value
+    
+    def set(self, key: str, value: str):
+        """保存响应，空响应不缓存"""
+        if not value:
+            return
+        self._remember(key, value)
+        
+        if self.cache_dir is None:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', dir=self.cache_dir,
+                                             prefix=f".{key}.", suffix=".tmp", delete=False) as tmp:
+                tmp.write(value)
+            os.replace(tmp.name, self.cache_dir / f"{key}.txt")
+        except OSError as e:
+            logger.warning(f"写入LLM磁盘缓存失败: {e}")
+    
+    def single_flight(self, key: str, compute: Callable[[], str]) -> str:
+        """
+        对同一缓存键只执行一次compute
+        
+        相同请求已在进行时，等待并返回其结果（或抛出其异常），不再重复调用API；
+        由本调用方执行时，先复查一次缓存，以免在前一个请求刚完成时重复调用。
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = self._inflight[key] = Future()
+        if not is_owner:
+            logger.info("⏳ [LLM请求合并] 相同请求正在进行，等待其结果")
+            return future.result()
+        
+        try:
+            result = self.get(key)
+            if result is None:
+                result = compute()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+    
+    def clear(self):
+        """清空内存缓存"""
+        with self._lock:
+            self._entries.clear()
+    
+    def _remember(self, key: str, value: str):
+        """写入内存LRU，超出容量时淘汰最久未使用的响应"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class SemanticResponseCache:
+    """
+    LLM响应语义缓存（可选，依赖 sentence-transformers，安装 faiss 时用其索引检索）
+    
+    精确缓存未命中时，在模型和提示词完全相同的历史请求中，用小型向量模型对输入数据编码，
+    查找最相近的一条，相似度不低于阈值时直接复用其响应。向量已归一化，内积即余弦相似度。
+    提示词不参与编码：提示词长达数KB，与输入拼接后会超出向量模型的长度上限，截断后同一提示词下的所有输入都一样。
+    未安装faiss时向量保存在numpy矩阵中，检索为一次矩阵向量乘法，缓存条目不多时同样足够快。
+    """
+    
+    # 新条目延迟合并写盘的时间（秒），避免每次保存响应都重写整个索引
+    PERSIST_DELAY = 5.0
+    
+    def __init__(self, threshold: float = 0.95, model_name: str = "BAAI/bge-small-zh-v1.5",
+                 cache_dir: Optional[Path] = None):
+        """
+        初始化语义缓存
+        
+        Args:
+            threshold: 命中所需的最低余弦相似度
+            model_name: 向量模型名称
+            cache_dir: 索引持久化目录，为None时只保存在内存中
+        """
+        self.threshold = threshold
+        self.model_name = model_name
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._encoder = None
+        self._dim = 0
+        # (模型, 提示词)哈希 -> (向量索引, 与索引中向量一一对应的响应)
+        # 已安装faiss时索引为faiss.IndexFlatIP，否则为形状 (N, dim) 的float32矩阵
+        self._partitions: Dict[str, Tuple[Any, List[str]]] = {}
+        self._lock = threading.Lock()
+        # 有未落盘的新条目时为True，由定时器合并写盘；写盘在锁外进行，不阻塞查询
+        self._dirty = False
+        self._persist_timer: Optional[threading.Timer] = None
+        self._persist_lock = threading.Lock()
+    
+    @staticmethod
+    def is_available() -> bool:
+        """可选依赖是否已安装"""
+        return SentenceTransformer is not None
+    
+    @staticmethod
+    def _partition_key(model: str, prompt: str) -> str:
+        """模型和提示词的哈希，与精确缓存键的前缀相同"""
+        return _prefix_hasher(model, prompt).hexdigest()
+    
+    @staticmethod
+    def _text_for(input_data: Any) -> str:
+        """用于编码的文本：截断后的输入数据"""
+        if not isinstance(input_data, str):
+            input_data = json.dumps(input_data, ensure_ascii=False, sort_keys=True, default=str)
+        return input_data[:2048]
+    
+    def _ensure_loaded(self):
+        """首次使用时加载向量模型和索引，调用方需持有锁"""
+        if self._encoder is not None:
+            return
+        self._encoder = SentenceTransformer(self.model_name)
+        self._dim = self._encoder.get_sentence_embedding_dimension()
+        
+        if self.cache_dir is None:
+            return
+        vectors_path = self.cache_dir / self._index_filename()
+        entries_path = self.cache_dir / "semantic_partitions.json"
+        if vectors_path.exists() and entries_path.exists():
+            try:
+                partitions = json.loads(entries_path.read_text(encoding='utf-8'))
+                with np.load(vectors_path) as arrays:
+                    for key, responses in partitions.items():
+                        if key not in arrays:
+                            continue
+                        index = faiss.deserialize_index(arrays[key]) if faiss is not None else arrays[key]
+                        # 两个文件不是同时写入的，向量数与响应数不一致（如写盘中途崩溃）时丢弃该分区
+                        if not self._index_matches(index, len(responses)):
+                            logger.warning(f"LLM语义缓存分区 {key[:12]} 的向量与响应数量不一致，已丢弃")
+                            continue
+                        self._partitions[key] = (index, responses)
+            except (OSError, KeyError, RuntimeError, ValueError) as e:
+                logger.warning(f"加载LLM语义缓存失败，将重新建立: {e}")
+                self._partitions = {}
+    
+    @staticmethod
+    def _index_filename() -> str:
+        """索引文件名，faiss索引与numpy矩阵的格式不同，分开保存"""
+        return "semantic_faiss.npz" if faiss is not None else "semantic_vectors.npz"
+    
+    def _index_matches(self, index, count: int) -> bool:
+        """索引中的向量数和维度是否与响应列表一致"""
+        if faiss is not None:
+            return index.ntotal == count and index.d == self._dim
+        return index.shape == (count, self._dim)
+    
+    def _new_index(self):
+        """创建空索引"""
+        return faiss.IndexFlatIP(self._dim) if faiss is not None else np.empty((0, self._dim), dtype='float32')
+    
+    @staticmethod
+    def _search(index, vector) -> Tuple[float, int]:
+        """返回最相近条目的 (相似度, 下标)，调用方需持有锁且索引非空"""
+        if faiss is not None:
+            scores, ids = index.search(vector, 1)
+            return float(scores[0][0]), int(ids[0][0])
+        scores = index @ vector[0]
+        idx = int(scores.argmax())
+        return float(scores[idx]), idx
+    
+    def _add(self, key: str, vector, response: str):
+        """向指定提示词的索引中追加一个向量及其响应，调用方需持有锁"""
+        index, responses = self._partitions.get(key) or (self._new_index(), [])
+        if faiss is not None:
+            index.add(vector)
+        else:
+            index = np.vstack([index, vector])
+        responses.append(response)
+        self._partitions[key] = (index, responses)
+    
+    def _embed(self, text: str):
+        """编码为归一化的float32向量"""
+        vector = self._encoder.encode([text], normalize_embeddings=True)
+        return np.asarray(vector, dtype='float32')
+    
+    def get(self, model: str, prompt: str, input_data: Any = None) -> Optional[str]:
+        """查找同一模型和提示词下输入语义相近的历史响应，未命中返回None"""
+        with self._lock:
+            self._ensure_loaded()
+            partition = self._partitions.get(self._partition_key(model, prompt))
+            if partition is None:
+                return None
+            index, responses = partition
+            score, idx = self._search(index, self._embed(self._text_for(input_data)))
+            if idx < 0 or idx >= len(responses) or score < self.threshold:
+                return None
+            logger.info(f"🧠 [LLM语义缓存命中] 相似度: {score:.3f}")
+            return responses[idx]
+    
+    def set(self, model: str, prompt: str, input_data: Any, response: str):
+        """保存响应，空响应不缓存"""
+        if not response:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._add(self._partition_key(model, prompt), self._embed(self._text_for(input_data)), response)
+            self._mark_dirty()
+    
+    def _mark_dirty(self):
+        """标记有未落盘的条目，并安排一次延迟写盘，调用方需持有锁"""
+        if self.cache_dir is None:
+            return
+        self._dirty = True
+        if self._persist_timer is None:
+            self._persist_timer = threading.Timer(self.PERSIST_DELAY, self.flush)
+            self._persist_timer.daemon = True
+            self._persist_timer.start()
+    
+    def flush(self):
+        """立即把尚未落盘的条目写入磁盘"""
+        with self._persist_lock:
+            with self._lock:
+                timer, self._persist_timer = self._persist_timer, None
+                if timer is not None:
+                    timer.cancel()
+                if not self._dirty:
+                    return
+                self._dirty = False
+                # 锁内只取快照：numpy矩阵追加时整体替换，引用即可；faiss索引会原地追加，需在锁内序列化
+                arrays = {
+                    key: faiss.serialize_index(index) if faiss is not None else index
+                    for key, (index, _) in self._partitions.items()
+                }
+                responses = {key: list(entries) for key, (_, entries) in self._partitions.items()}
+            self._persist(arrays, responses)
+    
+    def _persist(self, arrays: Dict[str, Any], responses: Dict[str, List[str]]):
+        """写入磁盘，两个文件都先写临时文件再原子替换"""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._atomic_write(self.cache_dir / self._index_filename(), lambda f: np.savez(f, **arrays))
+            payload = json.dumps(responses, ensure_ascii=False).encode('utf-8')
+            self._atomic_write(self.cache_dir / "semantic_partitions.json", lambda f: f.write(payload))
+        except (OSError, RuntimeError) as e:
+            logger.warning(f"写入LLM语义缓存失败: {e}")
+    
+    def _atomic_write(self, path: Path, write: Callable[[Any], Any]):
+        """先写入同目录临时文件再替换，避免崩溃时留下写了一半的文件"""
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix=f".{path.name}.",
+                                         suffix=".tmp", delete=False) as tmp:
+            try:
+                write(tmp)
+            except BaseException:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+        os.replace(tmp.name, path)
+
+# 按磁盘目录共享的缓存实例：各流水线步骤各自创建客户端，共享缓存才能互相命中
+_caches: Dict[Optional[str], LLMResponseCache] = {}
+_caches_lock = threading.Lock()
+
+def get_response_cache(cache_dir: Optional[str] = None) -> LLMResponseCache:
+    """获取指定磁盘目录对应的共享缓存实例"""
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = _caches[cache_dir] = LLMResponseCache(cache_dir=Path(cache_dir) if cache_dir else None)
+        return cache
+
+_semantic_caches: Dict[Tuple[Optional[str], float], SemanticResponseCache] = {}
+
+@atexit.register
+def _flush_semantic_caches():
+    """进程退出前写入语义缓存中尚未落盘的条目"""
+    for cache in list(_semantic_caches.values()):
+        cache.flush()
+
+def get_semantic_cache(cache_dir: Optional[str] = None,
+                       threshold: float = 0.95) -> Optional[SemanticResponseCache]:
+    """获取共享的语义缓存实例，未安装可选依赖时返回None"""
+    if not SemanticResponseCache.is_available():
+        logger.warning("未安装 sentence-transformers，LLM语义缓存不可用")
+        return None
+    with _caches_lock:
+        key = (cache_dir, threshold)
+        cache = _semantic_caches.get(key)
+        if cache is None:
+            cache = _semantic_caches[key] = SemanticResponseCache(
+                threshold=threshold, cache_dir=Path(cache_dir) if cache_dir else None
+            )
+        return cache
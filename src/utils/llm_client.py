@@ -1,96 +1,257 @@
 """
 大模型客户端 - 封装通义千问API调用
 """
+import asyncio
 import json
 import logging
 import os
 import re
-from typing import Dict, Any, List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional, Tuple
+import dashscope
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 from dashscope import Generation
-from dashscope.api_entities.dashscope_response import GenerationResponse
+from dashscope.api_entities.dashscope_response import DashScopeAPIResponse, GenerationResponse
 from collections.abc import Generator
 
 from ..config import MODEL_NAME
+from .error_handler import RetryConfig, TokenBucket
 from .json_utils import JSONUtils  # 导入统一的JSON工具类
+from .llm_cache import PROMPT_INPUT_SEPARATOR, build_llm_input, get_response_cache, get_semantic_cache
 
 logger = logging.getLogger(__name__)
 
+# 直连REST接口使用的共享会话：保持长连接，避免每次调用重新进行TCP和TLS握手
+_REST_PATH = "/services/aigc/text-generation/generation"
+_REST_TIMEOUT = (10, 300)  # (连接超时, 读取超时) 秒
+_rest_session: Optional[requests.Session] = None
+_rest_session_lock = threading.Lock()
+# call_with_retry的退避策略：带随机抖动，避免并发请求同时失败后在同一时刻重试
+_RETRY_BACKOFF = RetryConfig()
+
+def _get_rest_session() -> requests.Session:
+    """获取进程内共享的HTTP会话"""
+    global _rest_session
+    if _rest_session is None:
+        with _rest_session_lock:
+            if _rest_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _rest_session = session
+    return _rest_session
+
+def _is_connect_failure(exc: requests.RequestException) -> bool:
+    """请求是否在发出之前就失败了（连接超时、无法建立连接），只有这时回退SDK才不会重复计费"""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.ConnectionError) and not isinstance(exc, requests.Timeout):
+        # 连接阶段的失败被包装为MaxRetryError(reason=NewConnectionError)；发送后连接被重置则是ProtocolError
+        reason = getattr(exc.args[0], "reason", None) if exc.args else None
+        return isinstance(reason, NewConnectionError)
+    return False
+
+# 代码块起始标记（如"```json"）及其后的空白，JSON紧随其后时才认为是正文
+_CODE_FENCE_END = re.compile(r'```[A-Za-z]*[ \t]*\r?\n\s*$')
+# 判断代码块标记只需要JSON之前的最后一小段文字
+_FENCE_TAIL_CHARS = 64
+
+class _JSONEndDetector:
+    """
+    逐段扫描流式输出，找到第一个完整的顶层JSON对象或数组的结束位置
+    
+    只认位于响应开头或代码块标记之后的JSON，以免把说明文字里的括号（如“见下方[1]”）误当成JSON；
+    按括号深度跟踪（跳过字符串内的括号和转义），深度回到0时再用json.loads确认。
+    各状态均增量维护，总耗时与输出长度成线性关系。
+    """
+    
+    def __init__(self):
+        # 当前候选JSON在之前各段中的内容
+        self._value_parts: List[str] = []
+        # JSON之外的文字是否全是空白，以及其最后一小段（用于判断代码块标记）
+        self._only_space = True
+        self._tail = ""
+        self._depth = 0
+        self._in_str = False
+        self._escaped = False
+    
+    def feed(self, delta: str) -> int:
+        """追加一段输出，返回JSON在这段中结束的位置（下标），尚未结束时返回-1"""
+        # 本段中JSON之外文字的起点，以及候选JSON在本段中的起点
+        text_start = 0
+        value_start = 0
+        for i, ch in enumerate(delta):
+            if self._depth == 0:
+                if ch in '[{':
+                    self._append_text(delta[text_start:i])
+                    text_start = i
+                    if self._at_value_start():
+                        value_start = i
+                        self._depth = 1
+                continue
+            if self._in_str:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch in '[{':
+                self._depth += 1
+            elif ch in ']}':
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = ''.join(self._value_parts) + delta[value_start:i + 1]
+                    self._value_parts = []
+                    try:
+                        json.loads(candidate)
+                        return i
+                    except ValueError:
+                        # 不是JSON（如开头的“[共3条]”），之后只认代码块中的JSON
+                        text_start = i + 1
+                        continue
+        if self._depth == 0:
+            self._append_text(delta[text_start:])
+        else:
+            self._value_parts.append(delta[value_start:])
+        return -1
+    
+    def _at_value_start(self) -> bool:
+        """JSON之外的文字是否只有空白或以代码块起始标记结尾；是则从当前位置开始候选JSON"""
+        if not self._only_space and _CODE_FENCE_END.search(self._tail) is None:
+            return False
+        # 候选JSON即使解析失败，也已不是空白
+        self._only_space = False
+        self._tail = ""
+        return True
+    
+    def _append_text(self, text: str):
+        """记录JSON之外的文字"""
+        if not text:
+            return
+        if self._only_space and text.strip():
+            self._only_space = False
+        self._tail = (self._tail + text)[-_FENCE_TAIL_CHARS:]
+
 class LLMClient:
     """通义千问API客户端"""
     
-    def __init__(self, api_key: str = None, model: str = None):
+    def __init__(self, api_key: str = None, model: str = None,
+                 enable_cache: bool = False, cache_dir: Optional[str] = None,
+                 enable_semantic_cache: bool = False, semantic_threshold: float = 0.95,
+                 use_rest_session: bool = True, rate_limiter: Optional[TokenBucket] = None,
+                 compact_input: bool = False):
         """
         初始化通义千问客户端
         
         Args:
             api_key: API密钥，如果为None则从环境变量获取
             model: 模型名称，如果为None则使用默认模型
+            enable_cache: 是否对相同的提示词和输入复用已有响应
+            cache_dir: 响应磁盘缓存目录，为None时只缓存在内存中
+            enable_semantic_cache: 是否启用语义缓存（需安装sentence-transformers，可选faiss）
+            semantic_threshold: 语义缓存命中所需的最低相似度
+            use_rest_session: 是否通过共享长连接直接调用REST接口（连接失败时回退到SDK）
+            rate_limiter: 请求限流令牌桶，同一API密钥的客户端应共享同一个，为None时不限流
+            compact_input: 字典输入是否序列化为紧凑JSON（不缩进），减少输入token
         """
         self.model = model or MODEL_NAME
+        self.use_rest_session = use_rest_session
         self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+        self._cache = get_response_cache(cache_dir) if enable_cache else None
+        self._semantic_cache = (
+            get_semantic_cache(cache_dir, semantic_threshold) if enable_semantic_cache else None
+        )
+        self._rate_limiter = rate_limiter
+        self.compact_input = compact_input
     
-    def call(self, prompt: str, input_data: Any = None) -> str:
+    def call(self, prompt: str, input_data: Any = None, use_cache: bool = True,
+             max_tokens: Optional[int] = None) -> str:
         """
         调用大模型API
         
         Args:
             prompt: 提示词
             input_data: 输入数据
+            use_cache: 是否读取缓存；为False时强制重新调用（如解析失败后重试），新响应仍会写入缓存
+            max_tokens: 最多生成的token数（如测试连接），指定时不读写缓存，避免截断的响应被复用
             
         Returns:
             模型响应文本
         """
-        api_key = self.api_key
-        if not api_key:
+        if not self.api_key:
             raise ValueError("请配置API密钥，可以通过环境变量DASHSCOPE_API_KEY或在前端设置页面配置。")
-
+        
+        cache_key = self._cache.make_key(self.model, prompt, input_data) if self._cache is not None else None
+        if max_tokens is not None:
+            return self._request(prompt, input_data, None, max_tokens)
+        if use_cache:
+            cached = self._cached_response(cache_key, prompt, input_data)
+            if cached is not None:
+                return cached
+            if cache_key is not None:
+                # 相同请求正在进行时等待其结果，避免并发重复调用API
+                return self._cache.single_flight(cache_key, lambda: self._request(prompt, input_data, cache_key))
+        return self._request(prompt, input_data, cache_key)
+    
+    def _request(self, prompt: str, input_data: Any, cache_key: Optional[str],
+                 max_tokens: Optional[int] = None) -> str:
+        """实际发起API请求，成功的响应写入缓存（限制了max_tokens时不写入）"""
         try:
-            # 构建完整的输入
-            if input_data:
-                if isinstance(input_data, dict):
-                    full_input = f"{prompt}\n\n输入内容：\n{json.dumps(input_data, ensure_ascii=False, indent=2)}"
-                else:
-                    full_input = f"{prompt}\n\n输入内容：\n{input_data}"
-            else:
-                full_input = prompt
+            # 构建完整的输入（固定提示词在前，便于服务端前缀缓存命中）
+            full_input = build_llm_input(prompt, input_data, compact=self.compact_input)
             
             # 记录调用开始的详细信息
-            logger.info(f"🚀 [LLM调用开始] 模型: {self.model}")
-            logger.info(f"📝 [提示词长度]: {len(prompt)} 字符")
+            logger.info("🚀 [LLM调用开始] 模型: %s", self.model)
+            logger.info("📝 [提示词长度]: %s 字符", len(prompt))
             if input_data:
-                input_type = type(input_data).__name__
-                if isinstance(input_data, (dict, list)):
-                    input_size = len(json.dumps(input_data, ensure_ascii=False))
-                    logger.info(f"📊 [输入数据]: 类型={input_type}, 大小={input_size} 字符")
-                else:
-                    logger.info(f"📊 [输入数据]: 类型={input_type}, 长度={len(str(input_data))} 字符")
-            logger.info(f"🔢 [完整输入长度]: {len(full_input)} 字符")
-            logger.debug(f"📄 [完整输入内容前500字符]: {full_input[:500]}...")
+                # 输入数据已拼接在full_input中，直接按长度差计算，无需再次序列化
+                input_size = len(full_input) - len(prompt.rstrip()) - len(PROMPT_INPUT_SEPARATOR)
+                logger.info("📊 [输入数据]: 类型=%s, 大小=%s 字符", type(input_data).__name__, input_size)
+            logger.info("🔢 [完整输入长度]: %s 字符", len(full_input))
+            logger.debug("📄 [完整输入内容前500字符]: %s...", full_input[:500])
+            
+            # 主动限流：在服务商的QPS限制以内发送，避免触发429后再退避重试
+            if self._rate_limiter is not None:
+                self._rate_limiter.acquire()
             
             # 调用API
-            import time
-            start_time = time.time()
-            logger.info(f"⏱️ [API调用] 开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+            start_time = time.monotonic()
+            logger.info("⏱️ [API调用] 开始时间: %s", time.strftime('%Y-%m-%d %H:%M:%S'))
             
-            response_or_gen = Generation.call(
-                model=self.model,
-                prompt=full_input,
-                api_key=api_key,
-                stream=False, # 确保使用非流式调用
-            )
+            response_or_gen = None
+            if self.use_rest_session:
+                response_or_gen = self._call_rest(full_input, self.api_key, max_tokens)
+            if response_or_gen is None:
+                response_or_gen = Generation.call(
+                    model=self.model,
+                    prompt=full_input,
+                    api_key=self.api_key,
+                    stream=False, # 确保使用非流式调用
+                    **({'max_tokens': max_tokens} if max_tokens is not None else {})
+                )
             
-            end_time = time.time()
-            call_duration = end_time - start_time
-            logger.info(f"⏱️ [API调用] 耗时: {call_duration:.2f} 秒")
+            call_duration = time.monotonic() - start_time
+            logger.info("⏱️ [API调用] 耗时: %.2f 秒", call_duration)
             
             response: GenerationResponse
             if isinstance(response_or_gen, Generator):
-                response = next(response_or_gen)
+                # 生成器为空时返回None，而不是把StopIteration当作控制流程
+                response = next(response_or_gen, None)
+                if response is None:
+                    raise Exception("API调用未返回任何响应。")
             else:
                 response = response_or_gen
 
             # 详细检查API响应
-            logger.info(f"📥 [API响应] 状态码: {response.status_code if response else 'None'}")
+            logger.info("📥 [API响应] 状态码: %s", response.status_code if response else 'None')
             
             if response and response.status_code == 200:
                 if response.output and response.output.text is not None:
@@ -98,16 +259,18 @@ class LLMClient:
                     response_length = len(response_text)
                     finish_reason = response.output.finish_reason if response.output else 'unknown'
                     
-                    logger.info(f"✅ [API调用成功] 响应长度: {response_length} 字符")
-                    logger.info(f"🎯 [结束原因]: {finish_reason}")
-                    logger.debug(f"📄 [响应内容前500字符]: {response_text[:500]}...")
+                    logger.info("✅ [API调用成功] 响应长度: %s 字符", response_length)
+                    logger.info("🎯 [结束原因]: %s", finish_reason)
+                    logger.debug("📄 [响应内容前500字符]: %s...", response_text[:500])
                     
                     # 检查响应内容的基本质量
                     if response_length < 10:
-                        logger.warning(f"⚠️ [响应质量警告] 响应过短: {response_length} 字符")
+                        logger.warning("⚠️ [响应质量警告] 响应过短: %s 字符", response_length)
                     if '{' in response_text or '[' in response_text:
-                        logger.info(f"🔍 [响应格式] 检测到JSON格式内容")
+                        logger.info("🔍 [响应格式] 检测到JSON格式内容")
                     
+                    if max_tokens is None:
+                        self._store_response(cache_key, prompt, input_data, response_text)
                     return response_text
                 else:
                     # API成功但输出为空，可能是内容安全过滤等原因
@@ -115,7 +278,7 @@ class LLMClient:
                     usage_info = f"输入tokens: {response.usage.input_tokens if response.usage else 'N/A'}, 输出tokens: {response.usage.output_tokens if response.usage else 'N/A'}" if hasattr(response, 'usage') and response.usage else "使用量信息不可用"
                     
                     error_msg = f"API请求成功，但输出为空。结束原因: {finish_reason}, 使用量: {usage_info}"
-                    logger.warning(f"⚠️ [输出为空] {error_msg}")
+                    logger.warning("⚠️ [输出为空] %s", error_msg)
                     return "" # 返回空字符串，让上层处理
             else:
                 # API调用失败
@@ -123,31 +286,98 @@ class LLMClient:
                 message = response.message if hasattr(response, 'message') else '未知API错误'
                 status_code = response.status_code if response else 'N/A'
                 
-                logger.error(f"❌ [API调用失败] 状态码: {status_code}, 错误码: {code}")
-                logger.error(f"💬 [错误信息]: {message}")
+                logger.error("❌ [API调用失败] 状态码: %s, 错误码: %s", status_code, code)
+                logger.error("💬 [错误信息]: %s", message)
                 
                 if "Invalid ApiKey" in str(message):
-                    logger.error(f"🔑 [API Key错误] 请检查配置的API密钥是否正确")
+                    logger.error("🔑 [API Key错误] 请检查配置的API密钥是否正确")
                     raise ValueError("API Key无效或不正确，请检查配置并重新输入。")
-
+                if status_code in (400, 401, 403):
+                    # 参数错误、鉴权失败、无权限，重试也不会成功；限流(429)和服务端错误(5xx)仍会重试
+                    raise ValueError(f"API请求被拒绝 - Status: {status_code}, Code: {code}, Message: {message}")
+                
                 error_msg = f"API调用失败 - Status: {status_code}, Code: {code}, Message: {message}"
                 raise Exception(message)
                 
-        except StopIteration:
-            # next(response_gen) 可能在生成器为空时引发此异常
-            error_msg = "API调用未返回任何响应。"
-            logger.error(f"❌ [StopIteration错误] {error_msg}")
-            logger.error(f"📄 [调用上下文] 模型: {self.model}, 输入长度: {len(full_input)}")
-            raise Exception(error_msg)
         except Exception as e:
             error_type = type(e).__name__
             error_details = str(e)
-            logger.error(f"❌ [LLM调用异常] 类型: {error_type}")
-            logger.error(f"💬 [异常详情]: {error_details}")
-            logger.error(f"📄 [调用上下文] 模型: {self.model}, 输入长度: {len(full_input) if 'full_input' in locals() else 'N/A'}")
+            logger.error("❌ [LLM调用异常] 类型: %s", error_type)
+            logger.error("💬 [异常详情]: %s", error_details)
+            logger.error("📄 [调用上下文] 模型: %s, 输入长度: %s", self.model, len(full_input) if 'full_input' in locals() else 'N/A')
             raise
     
-    def call_with_retry(self, prompt: str, input_data: Any = None, max_retries: int = 3) -> str:
+    def _call_rest(self, full_input: str, api_key: str,
+                   max_tokens: Optional[int] = None) -> Optional[GenerationResponse]:
+        """
+        通过共享会话直接调用DashScope文本生成REST接口
+        
+        请求体与Generation.call的非流式调用一致。连接未建立时返回None，由调用方回退到SDK；
+        请求可能已发出的异常（如读取超时、连接被重置）和无法解析的响应直接抛出，交给call_with_retry处理，
+        避免同一请求再经SDK发送一次而重复计费。
+        """
+        url = dashscope.base_http_api_url.rstrip('/') + _REST_PATH
+        parameters = {"max_tokens": max_tokens} if max_tokens is not None else {}
+        payload = {"model": self.model, "input": {"prompt": full_input}, "parameters": parameters}
+        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        try:
+            resp = _get_rest_session().post(url, data=JSONUtils.dumps(payload).encode('utf-8'),
+                                            headers=headers, timeout=_REST_TIMEOUT)
+        except requests.RequestException as e:
+            if not _is_connect_failure(e):
+                raise
+            logger.warning("⚠️ [REST连接失败] %s: %s，回退到SDK调用", type(e).__name__, e)
+            return None
+        
+        try:
+            body = resp.json()
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            # 不用ValueError，以便call_with_retry按可重试错误处理
+            raise Exception(f"REST接口返回的不是JSON对象 - Status: {resp.status_code}")
+        
+        api_response = DashScopeAPIResponse(
+            status_code=resp.status_code,
+            request_id=body.get("request_id", ""),
+            code=body.get("code", ""),
+            message=body.get("message", ""),
+            output=body.get("output") or {},
+            usage=body.get("usage"),
+        )
+        return GenerationResponse.from_api_response(api_response)
+    
+    def _cached_response(self, cache_key: Optional[str], prompt: str, input_data: Any) -> Optional[str]:
+        """依次查找精确缓存和语义缓存"""
+        if cache_key is not None:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                logger.info("💾 [LLM缓存命中] 模型: %s, 响应长度: %s 字符", self.model, len(cached))
+                return cached
+        if self._semantic_cache is not None:
+            # 语义缓存是可选优化，模型加载、编码等任何失败都按未命中处理，不能让调用失败
+            try:
+                cached = self._semantic_cache.get(self.model, prompt, input_data)
+            except Exception as e:
+                logger.warning("⚠️ [LLM语义缓存查询失败] %s: %s", type(e).__name__, e)
+                cached = None
+            if cached is not None:
+                return cached
+        return None
+    
+    def _store_response(self, cache_key: Optional[str], prompt: str, input_data: Any, response_text: str):
+        """将成功的响应写入已启用的缓存"""
+        if cache_key is not None:
+            self._cache.set(cache_key, response_text)
+        if self._semantic_cache is not None:
+            # 响应已成功返回，写入语义缓存失败时只记录，不能丢弃响应并触发重试
+            try:
+                self._semantic_cache.set(self.model, prompt, input_data, response_text)
+            except Exception as e:
+                logger.warning("⚠️ [LLM语义缓存写入失败] %s: %s", type(e).__name__, e)
+    
+    def call_with_retry(self, prompt: str, input_data: Any = None, max_retries: int = 3,
+                        use_cache: bool = True) -> str:
         """
         带重试机制的API调用
         
@@ -155,77 +385,190 @@ class LLMClient:
             prompt: 提示词
             input_data: 输入数据
             max_retries: 最大重试次数
+            use_cache: 是否读取响应缓存
             
         Returns:
             模型响应文本
         """
-        logger.info(f"🔄 [重试机制] 开始调用，最大重试次数: {max_retries}")
+        logger.info("🔄 [重试机制] 开始调用，最大重试次数: %s", max_retries)
         
+        wait_time = _RETRY_BACKOFF.base_delay
         for attempt in range(max_retries):
             try:
-                logger.info(f"🔢 [第{attempt + 1}次尝试] 开始调用...")
-                result = self.call(prompt, input_data)
-                logger.info(f"✅ [第{attempt + 1}次尝试成功] 调用完成")
+                logger.info("🔢 [第%s次尝试] 开始调用...", attempt + 1)
+                result = self.call(prompt, input_data, use_cache=use_cache)
+                logger.info("✅ [第%s次尝试成功] 调用完成", attempt + 1)
                 return result
             except ValueError as ve: # 如果是API Key或参数错误，不重试
-                logger.error(f"❌ [不可重试错误] {str(ve)}")
+                logger.error("❌ [不可重试错误] %s", str(ve))
                 raise
             except Exception as e:
                 error_type = type(e).__name__
                 error_msg = str(e)
                 
                 if attempt == max_retries - 1:
-                    logger.error(f"❌ [重试失败] LLM调用在{max_retries}次重试后彻底失败")
-                    logger.error(f"💬 [最终错误] 类型: {error_type}, 信息: {error_msg}")
+                    logger.error("❌ [重试失败] LLM调用在%s次重试后彻底失败", max_retries)
+                    logger.error("💬 [最终错误] 类型: %s, 信息: %s", error_type, error_msg)
                     raise
                 
-                wait_time = 2 ** attempt
-                logger.warning(f"⚠️ [第{attempt + 1}次失败] 类型: {error_type}, 信息: {error_msg}")
-                logger.info(f"⏳ [等待重试] {wait_time}秒后进行第{attempt + 2}次尝试...")
+                wait_time = _RETRY_BACKOFF.compute_delay(attempt, wait_time)
+                logger.warning("⚠️ [第%s次失败] 类型: %s, 信息: %s", attempt + 1, error_type, error_msg)
+                logger.info("⏳ [等待重试] %.1f秒后进行第%s次尝试...", wait_time, attempt + 2)
                 
-                import time
-                time.sleep(wait_time)  # 指数退避
+                time.sleep(wait_time)  # 带抖动的退避
                 
         return "" # 确保所有路径都有返回值
     
-    def _preprocess_llm_response(self, response: str) -> str:
+    async def acall(self, prompt: str, input_data: Any = None, use_cache: bool = True) -> str:
         """
-        预处理LLM响应，移除常见的非JSON内容
+        异步调用，在线程池中执行带重试的同步调用，不阻塞事件循环
+        
+        Args:
+            prompt: 提示词
+            input_data: 输入数据
+            use_cache: 是否读取响应缓存
+            
+        Returns:
+            模型响应文本
+        """
+        return await asyncio.to_thread(self.call_with_retry, prompt, input_data, use_cache=use_cache)
+    
+    async def acall_many(self, items: List[Tuple[str, Any]], max_concurrency: int = 4) -> List[Any]:
+        """
+        并发执行多个相互独立的调用
+        
+        Args:
+            items: (提示词, 输入数据) 列表
+            max_concurrency: 同时进行的最大请求数
+            
+        Returns:
+            与items顺序一致的结果列表，失败的调用对应位置为异常对象
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(item: Tuple[str, Any]) -> str:
+            async with semaphore:
+                return await self.acall(*item)
+        
+        return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+    
+    def call_many(self, items: List[Tuple[str, Any]], max_concurrency: int = 4) -> List[Any]:
+        """
+        同步并发执行多个相互独立的调用
+        
+        流水线在事件循环线程中同步运行，无法使用asyncio.run，这里直接用线程池并发。
+        
+        Args:
+            items: (提示词, 输入数据) 列表
+            max_concurrency: 同时进行的最大请求数
+            
+        Returns:
+            与items顺序一致的结果列表，失败的调用对应位置为异常对象
+        """
+        def run(item: Tuple[str, Any]) -> Any:
+            try:
+                return self.call_with_retry(*item)
+            except Exception as e:
+                return e
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            return list(pool.map(run, items))
+    
+    def call_stream(self, prompt: str, input_data: Any = None,
+                    on_delta: Optional[Callable[[str], None]] = None,
+                    stop_at_json_end: bool = True, use_cache: bool = True) -> str:
+        """
+        流式调用大模型API
+        
+        边生成边接收，每段增量文本回调on_delta，便于界面实时展示；
+        stop_at_json_end为True时，第一个完整的JSON对象或数组接收完毕后立即停止，
+        省去模型在JSON之后继续输出说明文字的时间。
+        
+        Args:
+            prompt: 提示词
+            input_data: 输入数据
+            on_delta: 收到增量文本时的回调
+            stop_at_json_end: JSON结束后是否提前停止
+            use_cache: 是否读取响应缓存
+            
+        Returns:
+            模型响应文本（提前停止时只包含到JSON结束为止的内容，且不写入缓存）
         """
-        # 移除开头的标题和说明文字
-        lines = response.split('\n')
-        json_start = -1
+        if not self.api_key:
+            raise ValueError("请配置API密钥，可以通过环境变量DASHSCOPE_API_KEY或在前端设置页面配置。")
         
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            if stripped.startswith('[') or stripped.startswith('{'):
-                json_start = i
-                break
+        cache_key = self._cache.make_key(self.model, prompt, input_data) if self._cache is not None else None
+        if use_cache:
+            cached = self._cached_response(cache_key, prompt, input_data)
+            if cached is not None:
+                if on_delta is not None:
+                    on_delta(cached)
+                return cached
         
-        if json_start >= 0:
-            response = '\n'.join(lines[json_start:])
+        full_input = build_llm_input(prompt, input_data, compact=self.compact_input)
+        logger.info("🚀 [LLM流式调用开始] 模型: %s, 完整输入长度: %s 字符", self.model, len(full_input))
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
         
-        # 移除末尾的非JSON内容
-        if '```' in response:
-            # 如果有多个```，取第一个之前的内容
-            parts = response.split('```')
-            if len(parts) > 1:
-                response = parts[0]
+        start_time = time.monotonic()
+        responses = Generation.call(
+            model=self.model,
+            prompt=full_input,
+            api_key=self.api_key,
+            stream=True,
+            incremental_output=True,
+        )
+        detector = _JSONEndDetector() if stop_at_json_end else None
+        parts = []
+        stopped_early = False
+        try:
+            for response in responses:
+                if response.status_code != 200:
+                    logger.error("❌ [流式调用失败] 状态码: %s, 错误码: %s, 错误信息: %s",
+                                 response.status_code, response.code, response.message)
+                    if response.status_code in (400, 401, 403):
+                        raise ValueError(f"API请求被拒绝 - Status: {response.status_code}, Code: {response.code}, Message: {response.message}")
+                    raise Exception(response.message)
+                
+                delta = response.output.text if response.output and response.output.text else ''
+                end = detector.feed(delta) if detector is not None and delta else -1
+                if end >= 0:
+                    delta = delta[:end + 1]
+                if delta:
+                    parts.append(delta)
+                    if on_delta is not None:
+                        on_delta(delta)
+                if end >= 0:
+                    logger.info("✂️ [提前结束] JSON已完整，停止接收后续输出")
+                    stopped_early = True
+                    break
+        finally:
+            # 提前结束时关闭生成器，释放底层连接
+            close = getattr(responses, 'close', None)
+            if close is not None:
+                close()
         
-        return response.strip()
+        response_text = ''.join(parts)
+        logger.info("✅ [流式调用完成] 耗时: %.2f 秒, 响应长度: %s 字符", time.monotonic() - start_time, len(response_text))
+        # 提前停止的输出不是模型的完整响应，不写入缓存
+        if not stopped_early:
+            self._store_response(cache_key, prompt, input_data, response_text)
+        return response_text
+    
+    def _preprocess_llm_response(self, response: str) -> str:
+        """
+        预处理LLM响应，移除常见的非JSON内容
+        
+        与JSONUtils共用同一实现（使用模块级预编译的正则），避免两份逻辑各自逐行拆分
+        """
+        return JSONUtils.preprocess_llm_response(response)
     
     def _auto_fix_response(self, response: str) -> str:
         """
         自动修复常见的响应问题
         """
         # 移除BOM和特殊字符
-        response = response.lstrip('\ufeff')
-        response = response.strip()
-        
-        # 修复中文引号
-        response = response.replace('"', '\"').replace('"', '\"')
-        
-        return response
+        return JSONUtils.sanitize_string(response)
     
     def _validate_json_structure(self, parsed_data: Any) -> bool:
         """
@@ -233,12 +576,12 @@ class LLMClient:
         """
         try:
             if not isinstance(parsed_data, list):
-                logger.error(f"响应不是数组格式，实际类型: {type(parsed_data)}")
+                logger.error("响应不是数组格式，实际类型: %s", type(parsed_data))
                 return False
             
             for i, item in enumerate(parsed_data):
                 if not isinstance(item, dict):
-                    logger.error(f"第{i}个元素不是对象格式，实际类型: {type(item)}")
+                    logger.error("第%s个元素不是对象格式，实际类型: %s", i, type(item))
                     return False
                     
                 # 检查基本字段（可根据具体需求调整）
@@ -246,10 +589,10 @@ class LLMClient:
                     required_fields = ['outline', 'start_time', 'end_time']
                     for field in required_fields:
                         if field not in item:
-                            logger.error(f"第{i}个元素缺少必需字段: {field}")
+                            logger.error("第%s个元素缺少必需字段: %s", i, field)
                             return False
         except Exception as e:
-            logger.error(f"验证JSON结构时出错: {e}")
+            logger.error("验证JSON结构时出错: %s", e)
             return False
         
         return True
@@ -2,57 +2,130 @@
 LLM客户端工厂 - 根据配置选择使用通义千问或硅基流动API
 """
 import logging
-from typing import Optional
+import threading
+from typing import Dict, Optional, Tuple
+from .error_handler import TokenBucket
 from .llm_client import LLMClient
 from .siliconflow_client import SiliconFlowClient
 from ..config import config_manager
 
 logger = logging.getLogger(__name__)
 
+# 按 (提供商, API密钥) 共享的限流令牌桶：服务商的QPS限制针对密钥，各步骤创建的客户端需共用同一个桶
+_rate_limiters: Dict[Tuple[str, str, float], TokenBucket] = {}
+_rate_limiters_lock = threading.Lock()
+
+def _get_rate_limiter(provider: str, api_key: Optional[str]) -> Optional[TokenBucket]:
+    """获取共享的限流令牌桶，未配置llm_qps_limit时返回None"""
+    qps = config_manager.settings.llm_qps_limit
+    if not qps or qps <= 0:
+        return None
+    with _rate_limiters_lock:
+        key = (provider, api_key or "", qps)
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            # 容量为一秒的请求数，允许短时突发但平均速率不超过qps
+            limiter = _rate_limiters[key] = TokenBucket(capacity=max(1.0, qps), refill_per_sec=qps)
+        return limiter
+
+# 测试连接时回复的最大token数，回复非空即视为连接成功
+_TEST_MAX_TOKENS = 8
+
+# 复用的客户端：键为 (提供商, 密钥, 模型, 缓存和限流配置)，按创建顺序保存
+_MAX_CLIENTS = 8
+_clients: Dict[tuple, "LLMClient | SiliconFlowClient"] = {}
+_clients_lock = threading.Lock()
+
 class LLMFactory:
     """LLM客户端工厂"""
     
     @staticmethod
-    def create_client(provider: Optional[str] = None, api_key: Optional[str] = None, model: Optional[str] = None) -> LLMClient | SiliconFlowClient:
+    def create_client(provider: Optional[str] = None, api_key: Optional[str] = None, model: Optional[str] = None,
+                      reuse: bool = True) -> LLMClient | SiliconFlowClient:
         """
         创建LLM客户端
         
+        相同提供商、密钥、模型和缓存/限流配置的客户端在进程内复用，各流水线步骤共享已建立的连接池；
+        配置变化后会创建新的客户端。
+        
         Args:
             provider: API提供商，可选值：dashscope, siliconflow
             api_key: API密钥
             model: 模型名称
+            reuse: 是否复用已创建的客户端，为False时总是新建且不放入复用表（如测试连接）
             
         Returns:
             LLM客户端实例
         """
+        settings = config_manager.settings
         # 如果没有指定provider，从配置中获取
         if provider is None:
-            provider = config_manager.settings.api_provider
-        
-
+            provider = settings.api_provider
         
         if provider == "dashscope":
-            # 使用通义千问API
             if api_key is None:
-                api_key = config_manager.settings.dashscope_api_key
+                api_key = settings.dashscope_api_key
             if model is None:
-                model = config_manager.settings.model_name
-            
-            logger.info(f"创建通义千问客户端，模型: {model}")
-            return LLMClient(api_key=api_key, model=model)
-            
+                model = settings.model_name
         elif provider == "siliconflow":
-            # 使用硅基流动API
             if api_key is None:
-                api_key = config_manager.settings.siliconflow_api_key
+                api_key = settings.siliconflow_api_key
             if model is None:
-                model = config_manager.settings.siliconflow_model
-            
-            logger.info(f"创建硅基流动客户端，模型: {model}")
-            return SiliconFlowClient(api_key=api_key, model=model)
-            
+                model = settings.siliconflow_model
         else:
             raise ValueError(f"不支持的API提供商: {provider}，支持的值: dashscope, siliconflow")
+        
+        if not reuse:
+            return LLMFactory._build_client(provider, api_key, model)
+        
+        key = (provider, api_key, model, settings.llm_response_cache, settings.llm_cache_dir,
+               settings.llm_semantic_cache, settings.llm_semantic_cache_threshold,
+               settings.dashscope_use_rest_session, settings.llm_qps_limit, settings.llm_compact_input_json)
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = LLMFactory._build_client(provider, api_key, model)
+                # 超出上限时丢弃最早创建的客户端（不主动关闭，可能仍有步骤在使用）
+                while len(_clients) > _MAX_CLIENTS:
+                    _clients.pop(next(iter(_clients)))
+            return client
+    
+    @staticmethod
+    def _build_client(provider: str, api_key: Optional[str], model: str) -> LLMClient | SiliconFlowClient:
+        """按配置新建客户端"""
+        settings = config_manager.settings
+        if provider == "dashscope":
+            # 使用通义千问API
+            logger.info(f"创建通义千问客户端，模型: {model}")
+            return LLMClient(api_key=api_key, model=model,
+                             enable_cache=settings.llm_response_cache,
+                             cache_dir=settings.llm_cache_dir,
+                             enable_semantic_cache=settings.llm_semantic_cache,
+                             semantic_threshold=settings.llm_semantic_cache_threshold,
+                             use_rest_session=settings.dashscope_use_rest_session,
+                             rate_limiter=_get_rate_limiter(provider, api_key),
+                             compact_input=settings.llm_compact_input_json)
+        
+        # 使用硅基流动API
+        logger.info(f"创建硅基流动客户端，模型: {model}")
+        return SiliconFlowClient(api_key=api_key, model=model,
+                                 enable_cache=settings.llm_response_cache,
+                                 cache_dir=settings.llm_cache_dir,
+                                 enable_semantic_cache=settings.llm_semantic_cache,
+                                 semantic_threshold=settings.llm_semantic_cache_threshold,
+                                 rate_limiter=_get_rate_limiter(provider, api_key),
+                                 compact_input=settings.llm_compact_input_json)
+    
+    @staticmethod
+    def close_all():
+        """关闭并清空复用的客户端，释放其连接池（服务关闭时调用）"""
+        with _clients_lock:
+            clients = list(_clients.values())
+            _clients.clear()
+        for client in clients:
+            close = getattr(client, 'close', None)
+            if close is not None:
+                close()
     
     @staticmethod
     def get_default_client() -> LLMClient | SiliconFlowClient:
@@ -79,9 +152,10 @@ class LLMFactory:
         """
         try:
             logger.info(f"开始测试API连接: provider={provider}, model={model}")
-            client = LLMFactory.create_client(provider=provider, api_key=api_key, model=model)
-            # 发送一个简单的测试请求
-            test_response = client.call("请简单回复'测试成功'", "这是一个连接测试")
+            client = LLMFactory.create_client(provider=provider, api_key=api_key, model=model, reuse=False)
+            # 发送一个简单的测试请求（必须真实调用API，不读取缓存），只需几个token的回复
+            test_response = client.call("请简单回复'测试成功'", "这是一个连接测试", use_cache=False,
+                                        max_tokens=_TEST_MAX_TOKENS)
             logger.info(f"API测试响应: {test_response[:100]}...")
             
             # 只要API返回了响应就认为连接成功
@@ -1,28 +1,53 @@
 """
 硅基流动API客户端 - 封装硅基流动API调用
 """
-import json
+import asyncio
 import logging
 import os
 import re
-from typing import Dict, Any, List
-from openai import OpenAI
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from openai import AuthenticationError, BadRequestError, OpenAI, PermissionDeniedError
 from collections.abc import Generator
 
+from .error_handler import RetryConfig, TokenBucket
 from .json_utils import JSONUtils  # 导入统一的JSON工具类
+from .llm_cache import PROMPT_INPUT_SEPARATOR, build_llm_input, get_response_cache, get_semantic_cache
 
 logger = logging.getLogger(__name__)
 
+# call_with_retry的退避策略：带随机抖动，避免并发请求同时失败后在同一时刻重试
+_RETRY_BACKOFF = RetryConfig()
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """读取限流响应的Retry-After头（秒），没有或不是秒数时返回None"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    value = headers.get('retry-after') if headers is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
 class SiliconFlowClient:
     """硅基流动API客户端"""
     
-    def __init__(self, api_key: str = None, model: str = "Qwen/Qwen2.5-72B-Instruct"):
+    def __init__(self, api_key: str = None, model: str = "Qwen/Qwen2.5-72B-Instruct",
+                 enable_cache: bool = False, cache_dir: Optional[str] = None,
+                 enable_semantic_cache: bool = False, semantic_threshold: float = 0.95,
+                 rate_limiter: Optional[TokenBucket] = None, compact_input: bool = False):
         """
         初始化硅基流动客户端
         
         Args:
             api_key: API密钥，如果为None则从环境变量获取
             model: 模型名称
+            enable_cache: 是否对相同的提示词和输入复用已有响应
+            cache_dir: 响应磁盘缓存目录，为None时只缓存在内存中
+            enable_semantic_cache: 是否启用语义缓存（需安装sentence-transformers，可选faiss）
+            semantic_threshold: 语义缓存命中所需的最低相似度
+            rate_limiter: 请求限流令牌桶，同一API密钥的客户端应共享同一个，为None时不限流
+            compact_input: 字典输入是否序列化为紧凑JSON（不缩进），减少输入token
         """
         self.api_key = api_key or os.getenv("SILICONFLOW_API_KEY")
         self.model = model
@@ -35,57 +60,79 @@ class SiliconFlowClient:
             api_key=self.api_key,
             base_url=self.base_url
         )
+        self._cache = get_response_cache(cache_dir) if enable_cache else None
+        self._semantic_cache = (
+            get_semantic_cache(cache_dir, semantic_threshold) if enable_semantic_cache else None
+        )
+        self._rate_limiter = rate_limiter
+        self.compact_input = compact_input
     
-    def call(self, prompt: str, input_data: Any = None) -> str:
+    def close(self):
+        """关闭底层HTTP客户端，释放连接池"""
+        self.client.close()
+    
+    def call(self, prompt: str, input_data: Any = None, use_cache: bool = True,
+             max_tokens: Optional[int] = None) -> str:
         """
         调用硅基流动API
         
         Args:
             prompt: 提示词
             input_data: 输入数据
+            use_cache: 是否读取缓存；为False时强制重新调用（如解析失败后重试），新响应仍会写入缓存
+            max_tokens: 最多生成的token数（如测试连接），指定时不读写缓存，避免截断的响应被复用
             
         Returns:
             模型响应文本
         """
+        cache_key = self._cache.make_key(self.model, prompt, input_data) if self._cache is not None else None
+        if max_tokens is not None:
+            return self._request(prompt, input_data, None, max_tokens)
+        if use_cache:
+            cached = self._cached_response(cache_key, prompt, input_data)
+            if cached is not None:
+                return cached
+            if cache_key is not None:
+                # 相同请求正在进行时等待其结果，避免并发重复调用API
+                return self._cache.single_flight(cache_key, lambda: self._request(prompt, input_data, cache_key))
+        return self._request(prompt, input_data, cache_key)
+    
+    def _request(self, prompt: str, input_data: Any, cache_key: Optional[str],
+                 max_tokens: Optional[int] = None) -> str:
+        """实际发起API请求，成功的响应写入缓存（限制了max_tokens时不写入）"""
         try:
-            # 构建完整的输入
-            if input_data:
-                if isinstance(input_data, dict):
-                    full_input = f"{prompt}\n\n输入内容：\n{json.dumps(input_data, ensure_ascii=False, indent=2)}"
-                else:
-                    full_input = f"{prompt}\n\n输入内容：\n{input_data}"
-            else:
-                full_input = prompt
+            # 构建完整的输入（固定提示词在前，便于服务端前缀缓存命中）
+            full_input = build_llm_input(prompt, input_data, compact=self.compact_input)
             
             # 记录调用开始的详细信息
-            logger.info(f"🚀 [SiliconFlow调用开始] 模型: {self.model}")
-            logger.info(f"📝 [提示词长度]: {len(prompt)} 字符")
+            logger.info("🚀 [SiliconFlow调用开始] 模型: %s", self.model)
+            logger.info("📝 [提示词长度]: %s 字符", len(prompt))
             if input_data:
-                input_type = type(input_data).__name__
-                if isinstance(input_data, (dict, list)):
-                    input_size = len(json.dumps(input_data, ensure_ascii=False))
-                    logger.info(f"📊 [输入数据]: 类型={input_type}, 大小={input_size} 字符")
-                else:
-                    logger.info(f"📊 [输入数据]: 类型={input_type}, 长度={len(str(input_data))} 字符")
-            logger.info(f"🔢 [完整输入长度]: {len(full_input)} 字符")
-            logger.debug(f"📄 [完整输入内容前500字符]: {full_input[:500]}...")
+                # 输入数据已拼接在full_input中，直接按长度差计算，无需再次序列化
+                input_size = len(full_input) - len(prompt.rstrip()) - len(PROMPT_INPUT_SEPARATOR)
+                logger.info("📊 [输入数据]: 类型=%s, 大小=%s 字符", type(input_data).__name__, input_size)
+            logger.info("🔢 [完整输入长度]: %s 字符", len(full_input))
+            logger.debug("📄 [完整输入内容前500字符]: %s...", full_input[:500])
+            
+            # 主动限流：在服务商的QPS限制以内发送，避免触发429后再退避重试
+            if self._rate_limiter is not None:
+                self._rate_limiter.acquire()
             
             # 调用API
-            import time
-            start_time = time.time()
-            logger.info(f"⏱️ [API调用] 开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+            start_time = time.monotonic()
+            logger.info("⏱️ [API调用] 开始时间: %s", time.strftime('%Y-%m-%d %H:%M:%S'))
             
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {'role': 'user', 'content': full_input}
                 ],
-                stream=False
+                stream=False,
+                **({'max_tokens': max_tokens} if max_tokens is not None else {})
             )
             
-            end_time = time.time()
-            call_duration = end_time - start_time
-            logger.info(f"⏱️ [API调用] 耗时: {call_duration:.2f} 秒")
+            call_duration = time.monotonic() - start_time
+            logger.info("⏱️ [API调用] 耗时: %.2f 秒", call_duration)
             
             # 检查响应
             if response and response.choices:
@@ -94,34 +141,66 @@ class SiliconFlowClient:
                     response_length = len(content)
                     finish_reason = response.choices[0].finish_reason if response.choices[0] else 'unknown'
                     
-                    logger.info(f"✅ [API调用成功] 响应长度: {response_length} 字符")
-                    logger.info(f"🎯 [结束原因]: {finish_reason}")
-                    logger.debug(f"📄 [响应内容前500字符]: {content[:500]}...")
+                    logger.info("✅ [API调用成功] 响应长度: %s 字符", response_length)
+                    logger.info("🎯 [结束原因]: %s", finish_reason)
+                    logger.debug("📄 [响应内容前500字符]: %s...", content[:500])
                     
                     # 检查响应内容的基本质量
                     if response_length < 10:
-                        logger.warning(f"⚠️ [响应质量警告] 响应过短: {response_length} 字符")
+                        logger.warning("⚠️ [响应质量警告] 响应过短: %s 字符", response_length)
                     if '{' in content or '[' in content:
-                        logger.info(f"🔍 [响应格式] 检测到JSON格式内容")
+                        logger.info("🔍 [响应格式] 检测到JSON格式内容")
                     
+                    if max_tokens is None:
+                        self._store_response(cache_key, prompt, input_data, content)
                     return content
                 else:
-                    logger.warning(f"⚠️ [API请求成功，但输出为空] 结束原因: {response.choices[0].finish_reason if response.choices[0] else 'unknown'}")
+                    logger.warning("⚠️ [API请求成功，但输出为空] 结束原因: %s", response.choices[0].finish_reason if response.choices[0] else 'unknown')
                     return ""
             else:
                 error_msg = "API调用失败，未返回有效响应"
-                logger.error(f"❌ [API调用失败] {error_msg}")
+                logger.error("❌ [API调用失败] %s", error_msg)
                 raise Exception(error_msg)
                 
         except Exception as e:
             error_type = type(e).__name__
             error_details = str(e)
-            logger.error(f"❌ [硅基流动API调用异常] 类型: {error_type}")
-            logger.error(f"💬 [异常详情]: {error_details}")
-            logger.error(f"📄 [调用上下文] 模型: {self.model}, 输入长度: {len(full_input) if 'full_input' in locals() else 'N/A'}")
+            logger.error("❌ [硅基流动API调用异常] 类型: %s", error_type)
+            logger.error("💬 [异常详情]: %s", error_details)
+            logger.error("📄 [调用上下文] 模型: %s, 输入长度: %s", self.model, len(full_input) if 'full_input' in locals() else 'N/A')
             raise
     
-    def call_with_retry(self, prompt: str, input_data: Any = None, max_retries: int = 3) -> str:
+    def _cached_response(self, cache_key: Optional[str], prompt: str, input_data: Any) -> Optional[str]:
+        """依次查找精确缓存和语义缓存"""
+        if cache_key is not None:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                logger.info("💾 [LLM缓存命中] 模型: %s, 响应长度: %s 字符", self.model, len(cached))
+                return cached
+        if self._semantic_cache is not None:
+            # 语义缓存是可选优化，模型加载、编码等任何失败都按未命中处理，不能让调用失败
+            try:
+                cached = self._semantic_cache.get(self.model, prompt, input_data)
+            except Exception as e:
+                logger.warning("⚠️ [LLM语义缓存查询失败] %s: %s", type(e).__name__, e)
+                cached = None
+            if cached is not None:
+                return cached
+        return None
+    
+    def _store_response(self, cache_key: Optional[str], prompt: str, input_data: Any, response_text: str):
+        """将成功的响应写入已启用的缓存"""
+        if cache_key is not None:
+            self._cache.set(cache_key, response_text)
+        if self._semantic_cache is not None:
+            # 响应已成功返回，写入语义缓存失败时只记录，不能丢弃响应并触发重试
+            try:
+                self._semantic_cache.set(self.model, prompt, input_data, response_text)
+            except Exception as e:
+                logger.warning("⚠️ [LLM语义缓存写入失败] %s: %s", type(e).__name__, e)
+    
+    def call_with_retry(self, prompt: str, input_data: Any = None, max_retries: int = 3,
+                        use_cache: bool = True) -> str:
         """
         带重试机制的API调用
         
@@ -129,39 +208,99 @@ class SiliconFlowClient:
             prompt: 提示词
             input_data: 输入数据
             max_retries: 最大重试次数
+            use_cache: 是否读取响应缓存
             
         Returns:
             模型响应文本
         """
-        logger.info(f"🔄 [SiliconFlow重试机制] 开始调用，最大重试次数: {max_retries}")
+        logger.info("🔄 [SiliconFlow重试机制] 开始调用，最大重试次数: %s", max_retries)
         
+        wait_time = _RETRY_BACKOFF.base_delay
         for attempt in range(max_retries):
             try:
-                logger.info(f"🔢 [第{attempt + 1}次尝试] 开始调用...")
-                result = self.call(prompt, input_data)
-                logger.info(f"✅ [第{attempt + 1}次尝试成功] 调用完成")
+                logger.info("🔢 [第%s次尝试] 开始调用...", attempt + 1)
+                result = self.call(prompt, input_data, use_cache=use_cache)
+                logger.info("✅ [第%s次尝试成功] 调用完成", attempt + 1)
                 return result
-            except ValueError as ve: # 如果是API Key或参数错误，不重试
-                logger.error(f"❌ [不可重试错误] {str(ve)}")
+            except (ValueError, BadRequestError, AuthenticationError, PermissionDeniedError) as ve: # 如果是API Key或参数错误，不重试
+                logger.error("❌ [不可重试错误] %s", str(ve))
                 raise
             except Exception as e:
                 error_type = type(e).__name__
                 error_msg = str(e)
                 
                 if attempt == max_retries - 1:
-                    logger.error(f"❌ [重试失败] 硅基流动API调用在{max_retries}次重试后彻底失败")
-                    logger.error(f"💬 [最终错误] 类型: {error_type}, 信息: {error_msg}")
+                    logger.error("❌ [重试失败] 硅基流动API调用在%s次重试后彻底失败", max_retries)
+                    logger.error("💬 [最终错误] 类型: %s, 信息: %s", error_type, error_msg)
                     raise
                 
-                wait_time = 2 ** attempt
-                logger.warning(f"⚠️ [第{attempt + 1}次失败] 类型: {error_type}, 信息: {error_msg}")
-                logger.info(f"⏳ [等待重试] {wait_time}秒后进行第{attempt + 2}次尝试...")
+                wait_time = _RETRY_BACKOFF.compute_delay(attempt, wait_time)
+                # 服务端通过Retry-After给出了等待时间时，至少等待这么久
+                retry_after = _retry_after_seconds(e)
+                if retry_after is not None:
+                    wait_time = max(wait_time, retry_after)
+                logger.warning("⚠️ [第%s次失败] 类型: %s, 信息: %s", attempt + 1, error_type, error_msg)
+                logger.info("⏳ [等待重试] %.1f秒后进行第%s次尝试...", wait_time, attempt + 2)
                 
-                import time
-                time.sleep(wait_time)  # 指数退避
+                time.sleep(wait_time)  # 带抖动的退避
                 
         return "" # 确保所有路径都有返回值
     
+    async def acall(self, prompt: str, input_data: Any = None, use_cache: bool = True) -> str:
+        """
+        异步调用，在线程池中执行带重试的同步调用，不阻塞事件循环
+        
+        Args:
+            prompt: 提示词
+            input_data: 输入数据
+            use_cache: 是否读取响应缓存
+            
+        Returns:
+            模型响应文本
+        """
+        return await asyncio.to_thread(self.call_with_retry, prompt, input_data, use_cache=use_cache)
+    
+    async def acall_many(self, items: List[Tuple[str, Any]], max_concurrency: int = 4) -> List[Any]:
+        """
+        并发执行多个相互独立的调用
+        
+        Args:
+            items: (提示词, 输入数据) 列表
+            max_concurrency: 同时进行的最大请求数
+            
+        Returns:
+            与items顺序一致的结果列表，失败的调用对应位置为异常对象
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(item: Tuple[str, Any]) -> str:
+            async with semaphore:
+                return await self.acall(*item)
+        
+        return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+    
+    def call_many(self, items: List[Tuple[str, Any]], max_concurrency: int = 4) -> List[Any]:
+        """
+        同步并发执行多个相互独立的调用
+        
+        流水线在事件循环线程中同步运行，无法使用asyncio.run，这里直接用线程池并发。
+        
+        Args:
+            items: (提示词, 输入数据) 列表
+            max_concurrency: 同时进行的最大请求数
+            
+        Returns:
+            与items顺序一致的结果列表，失败的调用对应位置为异常对象
+        """
+        def run(item: Tuple[str, Any]) -> Any:
+            try:
+                return self.call_with_retry(*item)
+            except Exception as e:
+                return e
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            return list(pool.map(run, items))
+    
     def parse_json_response(self, response: str) -> Any:
         """
         从可能包含Markdown格式的文本中解析JSON对象。
@@ -175,12 +314,12 @@ class SiliconFlowClient:
         """
         try:
             if not isinstance(parsed_data, list):
-                logger.error(f"响应不是数组格式，实际类型: {type(parsed_data)}")
+                logger.error("响应不是数组格式，实际类型: %s", type(parsed_data))
                 return False
             
             for i, item in enumerate(parsed_data):
                 if not isinstance(item, dict):
-                    logger.error(f"第{i}个元素不是对象格式，实际类型: {type(item)}")
+                    logger.error("第%s个元素不是对象格式，实际类型: %s", i, type(item))
                     return False
                     
                 # 检查基本字段（可根据具体需求调整）
@@ -188,10 +327,10 @@ class SiliconFlowClient:
                     required_fields = ['outline', 'start_time', 'end_time']
                     for field in required_fields:
                         if field not in item:
-                            logger.error(f"第{i}个元素缺少必需字段: {field}")
+                            logger.error("第%s个元素缺少必需字段: %s", i, field)
                             return False
         except Exception as e:
-            logger.error(f"验证JSON结构时出错: {e}")
+            logger.error("验证JSON结构时出错: %s", e)
             return False
         
         return True
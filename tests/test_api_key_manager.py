@@ -0,0 +1,105 @@
+"""
+API密钥管理器单元测试
+"""
+import gc
+import json
+import weakref
+
+import pytest
+from cryptography.fernet import Fernet, InvalidToken
+
+from src.utils.api_key_manager import APIKeyManager
+from src.utils.error_handler import ConfigurationError
+
+
+@pytest.fixture(autouse=True)
+def fast_kdf(monkeypatch):
+    """降低PBKDF2迭代次数，避免测试变慢"""
+    monkeypatch.setattr(APIKeyManager, "KDF_ITERATIONS", 1000)
+    monkeypatch.setattr(APIKeyManager, "_LEGACY_ITERATIONS", 1000)
+
+
+def _legacy_fernet(password: str) -> Fernet:
+    """旧版本直接由主密码派生的加密器"""
+    manager = APIKeyManager.__new__(APIKeyManager)
+    manager.master_password = password
+    return Fernet(manager._derive_key(APIKeyManager._LEGACY_SALT, APIKeyManager._LEGACY_ITERATIONS))
+
+
+def _write_legacy_keystore(path, password: str) -> bytes:
+    """写入一个旧版本格式的密钥库，返回密文"""
+    keys = {"old": {"api_key": "sk-" + "o" * 20, "provider": "dashscope", "is_active": True}}
+    encrypted = _legacy_fernet(password).encrypt(json.dumps(keys).encode())
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "keys.enc").write_bytes(encrypted)
+    return encrypted
+
+
+class TestAPIKeyManager:
+    """测试API密钥管理器"""
+    
+    def test_invalid_expires_at_keeps_other_keys(self, tmp_path):
+        """测试单个密钥的过期时间损坏时不会丢弃整个密钥库"""
+        manager = APIKeyManager(storage_path=tmp_path, master_password="pw")
+        manager.add_api_key("good", "sk-" + "a" * 20)
+        manager.add_api_key("bad", "sk-" + "b" * 20)
+        manager.keys["bad"]["expires_at"] = "不是时间"
+        manager._save_keys()
+        
+        reopened = APIKeyManager(storage_path=tmp_path, master_password="pw")
+        assert set(reopened.keys) == {"good", "bad"}
+        assert reopened.get_api_key("bad") == "sk-" + "b" * 20
+    
+    def test_active_key_prefers_first_added_on_tie(self, tmp_path):
+        """测试都未使用过时按添加顺序返回第一个密钥，与哈希种子无关"""
+        manager = APIKeyManager(storage_path=tmp_path, master_password="pw")
+        for i in range(5):
+            manager.add_api_key(f"key{i}", f"sk-{i}" + "x" * 20)
+        assert manager.get_active_api_key() == "sk-0" + "x" * 20
+        
+        reopened = APIKeyManager(storage_path=tmp_path, master_password="pw")
+        assert reopened.get_active_api_key() == "sk-0" + "x" * 20
+    
+    def test_instance_not_kept_alive_after_use(self, tmp_path):
+        """测试退出钩子不会让已丢弃的实例一直存活"""
+        manager = APIKeyManager(storage_path=tmp_path, master_password="pw")
+        ref = weakref.ref(manager)
+        del manager
+        gc.collect()
+        assert ref() is None
+    
+    def test_legacy_keystore_migrated_to_seal(self, tmp_path):
+        """测试旧版密钥库加载后迁移到密封的数据密钥"""
+        _write_legacy_keystore(tmp_path, "pw")
+        
+        manager = APIKeyManager(storage_path=tmp_path, master_password="pw")
+        assert manager.get_api_key("old") == "sk-" + "o" * 20
+        assert (tmp_path / "key.seal").exists()
+        with pytest.raises(InvalidToken):
+            _legacy_fernet("pw").decrypt((tmp_path / "keys.enc").read_bytes())
+        
+        reopened = APIKeyManager(storage_path=tmp_path, master_password="pw")
+        assert reopened.get_api_key("old") == "sk-" + "o" * 20
+    
+    def test_interrupted_migration_recovers_legacy_keys(self, tmp_path):
+        """测试写入key.seal后、重写密文前中断的迁移，重启后仍能读出密钥"""
+        legacy_data = _write_legacy_keystore(tmp_path, "pw")
+        APIKeyManager(storage_path=tmp_path, master_password="pw")
+        # 模拟崩溃：新的key.seal已落盘，keys.enc仍是旧版密文
+        (tmp_path / "keys.enc").write_bytes(legacy_data)
+        
+        manager = APIKeyManager(storage_path=tmp_path, master_password="pw")
+        assert manager.get_api_key("old") == "sk-" + "o" * 20
+        
+        reopened = APIKeyManager(storage_path=tmp_path, master_password="pw")
+        assert reopened.get_api_key("old") == "sk-" + "o" * 20
+    
+    def test_wrong_password_leaves_keystore_untouched(self, tmp_path):
+        """测试主密码错误时报错且不改动已有文件"""
+        APIKeyManager(storage_path=tmp_path, master_password="pw").add_api_key("k", "sk-" + "k" * 20)
+        before = {p.name: p.read_bytes() for p in tmp_path.iterdir()}
+        
+        with pytest.raises(ConfigurationError):
+            APIKeyManager(storage_path=tmp_path, master_password="wrong")
+        
+        assert {p.name: p.read_bytes() for p in tmp_path.iterdir()} == before
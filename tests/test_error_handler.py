@@ -9,7 +9,7 @@ from src.utils.error_handler import (
     AutoClipsException, APIError, NetworkError, ConfigurationError,
     FileIOError, ProcessingError, ValidationError,
     ErrorLevel, ErrorCategory, RetryConfig, CircuitBreaker,
-    retry_with_backoff, error_context, ErrorHandler, safe_execute
+    retry_with_backoff, error_context, ErrorHandler, safe_execute, TokenBucket
 )
 
 
@@ -106,6 +106,59 @@ class TestRetryConfig:
         assert config.max_retries == 5
         assert config.base_delay == 2.0
         assert config.max_delay == 120.0
+    
+    def test_retry_config_delay_without_jitter(self):
+        """测试不加抖动时为固定指数退避"""
+        config = RetryConfig(base_delay=1.0, max_delay=5.0, jitter="none")
+        delays = [config.compute_delay(attempt, 1.0) for attempt in range(5)]
+        assert delays == [1.0, 2.0, 4.0, 5.0, 5.0]
+    
+    def test_retry_config_delay_with_jitter(self):
+        """测试各抖动策略的等待时间范围"""
+        decorrelated = RetryConfig(base_delay=1.0, max_delay=10.0)
+        full = RetryConfig(base_delay=1.0, max_delay=10.0, jitter="full")
+        equal = RetryConfig(base_delay=1.0, max_delay=10.0, jitter="equal")
+        
+        prev_delay = 1.0
+        for attempt in range(20):
+            prev_delay = decorrelated.compute_delay(attempt, prev_delay)
+            assert 1.0 <= prev_delay <= 10.0
+            assert 0 <= full.compute_delay(3, 1.0) <= 8.0
+            assert 4.0 <= equal.compute_delay(3, 1.0) <= 8.0
+
+
+class TestTokenBucket:
+    """测试重试预算令牌桶"""
+    
+    def test_token_bucket_consume_and_refill(self):
+        """测试令牌耗尽后按速率恢复"""
+        with patch('time.monotonic', return_value=1000):
+            bucket = TokenBucket(capacity=2, refill_per_sec=1)
+            assert bucket.try_consume()
+            assert bucket.try_consume()
+            assert not bucket.try_consume()
+        
+        with patch('time.monotonic', return_value=1001):
+            assert bucket.try_consume()
+            assert not bucket.try_consume()
+        
+        with patch('time.monotonic', return_value=1100):
+            bucket.try_consume(0)
+            assert bucket.tokens == 2  # 不超过容量
+    
+    def test_token_bucket_acquire_waits_for_refill(self):
+        """测试acquire在令牌不足时等待补充"""
+        clock = [1000.0]
+        
+        def fake_sleep(seconds):
+            clock[0] += seconds
+        
+        with patch('time.monotonic', side_effect=lambda: clock[0]), patch('time.sleep', side_effect=fake_sleep) as sleep:
+            bucket = TokenBucket(capacity=1, refill_per_sec=2)
+            bucket.acquire()
+            sleep.assert_not_called()
+            bucket.acquire()
+            sleep.assert_called_once_with(0.5)
 
 
 class TestCircuitBreaker:
@@ -136,14 +189,14 @@ class TestCircuitBreaker:
             raise ValueError("测试失败")
         
         # 第一次失败
-        with patch('time.time', return_value=1000):
+        with patch('time.monotonic', return_value=1000):
             with pytest.raises(ValueError):
                 cb.call(failing_func)
             assert cb.state == "CLOSED"
             assert cb.failure_count == 1
         
         # 第二次失败，触发熔断
-        with patch('time.time', return_value=1001):
+        with patch('time.monotonic', return_value=1001):
             with pytest.raises(ValueError):
                 cb.call(failing_func)
             assert cb.state == "OPEN"
@@ -157,19 +210,48 @@ class TestCircuitBreaker:
             raise ValueError("测试失败")
         
         # 触发熔断
-        with patch('time.time', return_value=1000):
+        with patch('time.monotonic', return_value=1000):
             with pytest.raises(ValueError):
                 cb.call(failing_func)
             assert cb.state == "OPEN"
         
         # 等待恢复时间后，状态变为半开
-        with patch('time.time', return_value=1002):  # 超过恢复时间
+        with patch('time.monotonic', return_value=1002):  # 超过恢复时间
             def success_func():
                 return "success"
             
             result = cb.call(success_func)
             assert result == "success"
             assert cb.state == "CLOSED"  # 成功后关闭
+    
+    def test_circuit_breaker_recovery_backoff(self):
+        """测试半开探测失败后恢复时间指数增长"""
+        cb = CircuitBreaker(failure_threshold=1, recovery_timeout=1.0)
+        
+        def failing_func():
+            raise ValueError("测试失败")
+        
+        with patch('time.monotonic', return_value=1000):
+            with pytest.raises(ValueError):
+                cb.call(failing_func)
+        
+        # 半开探测失败，恢复时间翻倍
+        with patch('time.monotonic', return_value=1002):
+            with pytest.raises(ValueError):
+                cb.call(failing_func)
+            assert cb.state == "OPEN"
+            assert cb.effective_recovery_timeout == 2.0
+        
+        # 未超过翻倍后的恢复时间，仍然拒绝执行
+        with patch('time.monotonic', return_value=1003.5):
+            with pytest.raises(AutoClipsException):
+                cb.call(lambda: "success")
+        
+        # 超过恢复时间后探测成功，恢复时间重置
+        with patch('time.monotonic', return_value=1004.5):
+            assert cb.call(lambda: "success") == "success"
+            assert cb.state == "CLOSED"
+            assert cb.effective_recovery_timeout == 1.0
 
 
 class TestRetryDecorator:
@@ -208,6 +290,21 @@ class TestRetryDecorator:
         
         with pytest.raises(APIError):
             always_failing()
+    
+    def test_retry_budget_exhausted_fails_fast(self):
+        """测试重试预算耗尽时不再重试"""
+        call_count = 0
+        budget = TokenBucket(capacity=1, refill_per_sec=0)
+        
+        @retry_with_backoff(RetryConfig(max_retries=5, base_delay=0.01, retry_budget=budget))
+        def always_failing():
+            nonlocal call_count
+            call_count += 1
+            raise NetworkError("网络错误")
+        
+        with pytest.raises(NetworkError):
+            always_failing()
+        assert call_count == 2  # 首次调用 + 预算内的1次重试
 
 
 class TestErrorContext:
@@ -294,6 +391,19 @@ class TestErrorHandler:
         
         handler.clear_error_log()
         assert len(handler.error_log) == 0
+        assert handler.get_error_summary()["total_errors"] == 0
+    
+    def test_error_handler_bounded_error_log(self):
+        """测试错误日志有界且摘要计数保持累计"""
+        handler = ErrorHandler(max_log_size=2)
+        for i in range(5):
+            handler.handle_error(APIError(f"API错误{i}"))
+        
+        assert len(handler.error_log) == 2
+        summary = handler.get_error_summary()
+        assert summary["total_errors"] == 5
+        assert summary["error_counts"]["API"] == 5
+        assert summary["latest_error"]["message"] == "API错误4"
 
 
 class TestSafeExecute:
@@ -0,0 +1,110 @@
+"""
+JSON工具类单元测试
+"""
+import pytest
+
+from src.utils.json_utils import JSONUtils
+
+
+class TestSanitizeString:
+    """测试字符串净化"""
+    
+    def test_sanitize_removes_bom_and_whitespace(self):
+        """测试移除BOM和首尾空白"""
+        assert JSONUtils.sanitize_string('\ufeff  {"a": 1}  ') == '{"a": 1}'
+    
+    def test_sanitize_removes_control_characters(self):
+        """测试移除控制字符但保留换行和制表符"""
+        assert JSONUtils.sanitize_string('{"a":\x01 "b\x7f"}\n\t') == '{"a": "b"}'
+        assert JSONUtils.sanitize_string('[1,\n\t2]') == '[1,\n\t2]'
+
+
+class TestDumps:
+    """测试JSON序列化"""
+    
+    def test_dumps_keeps_non_ascii_and_indents(self):
+        """测试保留中文并支持缩进"""
+        assert JSONUtils.dumps({"a": "中文"}) in ('{"a":"中文"}', '{"a": "中文"}')
+        assert JSONUtils.dumps({"a": [1]}, indent=True) == '{\n  "a": [\n    1\n  ]\n}'
+    
+    def test_dumps_falls_back_for_non_string_keys(self):
+        """测试非字符串键回退到标准库"""
+        assert JSONUtils.dumps({1: "x"}) == '{"1": "x"}'
+
+
+class TestFixJsonErrors:
+    """测试JSON错误修复"""
+    
+    def test_fix_missing_commas_and_trailing_commas(self):
+        """测试修复缺失和多余的逗号"""
+        assert JSONUtils.fix_common_json_errors('[{"a":1}{"b":2},]') == '[{"a":1},{"b":2}]'
+    
+    def test_fix_quotes_and_bare_keys(self):
+        """测试修复单引号和未加引号的字段名"""
+        assert JSONUtils.fix_common_json_errors("{'a': 'b'}") == '{"a": "b"}'
+        assert JSONUtils.fix_common_json_errors('{a: 1}') == '{"a": 1}'
+    
+    def test_fix_quotes_keeps_apostrophes_inside_strings(self):
+        """测试双引号字符串内的单引号不被替换"""
+        fixed = JSONUtils.fix_common_json_errors('{"title": "it\'s a \'test\': ok", \'n\': \'v\'}')
+        assert fixed == '{"title": "it\'s a \'test\': ok", "n": "v"}'
+    
+    def test_fix_unclosed_structures(self):
+        """测试补全未闭合的括号"""
+        assert JSONUtils.fix_common_json_errors('[{"a": 1}') == '[{"a": 1}]'
+    
+    def test_fix_truncated_json(self):
+        """测试修复被截断的JSON"""
+        assert JSONUtils.fix_truncated_json('[{"a": 1}, {"b": 2...') == '[{"a": 1}, {"b": 2}]'
+        assert JSONUtils.fix_truncated_json('') == ''
+
+
+class TestParseJsonResponse:
+    """测试LLM响应解析"""
+    
+    def test_parse_plain_json(self):
+        """测试直接解析合法JSON"""
+        assert JSONUtils.parse_json_response('[{"a": 1}]') == [{"a": 1}]
+    
+    def test_parse_markdown_code_block(self):
+        """测试从Markdown代码块中提取JSON"""
+        response = '```json\n{"outline": ["x", "y"]}\n```'
+        assert JSONUtils.parse_json_response(response) == {"outline": ["x", "y"]}
+    
+    def test_parse_with_leading_text(self):
+        """测试跳过JSON之前的说明文字"""
+        response = '以下是结果：\n[{"title": "测试"}]'
+        assert JSONUtils.parse_json_response(response) == [{"title": "测试"}]
+    
+    def test_parse_json_containing_code_fence(self):
+        """测试字符串值中含有代码块标记的合法JSON按整体解析"""
+        response = '{"code": "```json\\n[1]\\n```"}'
+        assert JSONUtils.parse_json_response(response) == {"code": "```json\n[1]\n```"}
+    
+    def test_parse_ignores_trailing_text(self):
+        """测试忽略JSON之后带括号的说明文字"""
+        response = '[{"title": "测试"}]\n说明：以上结果共1条}'
+        assert JSONUtils.parse_json_response(response) == [{"title": "测试"}]
+    
+    def test_parse_repairs_common_errors(self):
+        """测试修复常见错误后解析"""
+        assert JSONUtils.parse_json_response("[{'title': 'a'},]") == [{"title": "a"}]
+    
+    def test_parse_invalid_response_raises(self, tmp_path, monkeypatch):
+        """测试无法解析时抛出ValueError"""
+        monkeypatch.setattr('tempfile.tempdir', str(tmp_path))
+        monkeypatch.delenv('AUTOCLIP_DEBUG_DUMP', raising=False)
+        with pytest.raises(ValueError):
+            JSONUtils.parse_json_response('完全没有JSON内容')
+        assert list(tmp_path.iterdir()) == []  # 默认不保存调试文件
+    
+    def test_parse_failure_dump_is_opt_in_and_capped(self, tmp_path, monkeypatch):
+        """测试开启后保存截断的调试文件"""
+        monkeypatch.setattr('tempfile.tempdir', str(tmp_path))
+        monkeypatch.setenv('AUTOCLIP_DEBUG_DUMP', '1')
+        monkeypatch.setattr('src.utils.json_utils._DUMP_COUNTER', 0)
+        with pytest.raises(ValueError):
+            JSONUtils.parse_json_response('[' + '1 ' * 40_000 + ']')
+        dumps = list(tmp_path.iterdir())
+        assert len(dumps) == 1
+        assert len(dumps[0].read_text(encoding='utf-8')) == 64 * 1024
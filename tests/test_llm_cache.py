@@ -0,0 +1,165 @@
+"""
+LLM响应缓存单元测试
+"""
+import json
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.utils import llm_cache
+from src.utils.llm_cache import LLMResponseCache, SemanticResponseCache, build_llm_input
+
+
+class TestLLMResponseCache:
+    """测试LLM响应缓存"""
+    
+    def test_make_key_ignores_dict_order(self):
+        """测试输入数据的键顺序不影响缓存键"""
+        key1 = LLMResponseCache.make_key("qwen-plus", "提示词", {"a": 1, "b": 2})
+        key2 = LLMResponseCache.make_key("qwen-plus", "提示词", {"b": 2, "a": 1})
+        assert key1 == key2
+        assert key1 != LLMResponseCache.make_key("qwen-turbo", "提示词", {"a": 1, "b": 2})
+    
+    def test_memory_cache_lru_eviction(self):
+        """测试内存缓存超出容量时淘汰最久未使用的响应"""
+        cache = LLMResponseCache(max_entries=2)
+        cache.set("k1", "v1")
+        cache.set("k2", "v2")
+        assert cache.get("k1") == "v1"  # k1变为最近使用
+        cache.set("k3", "v3")
+        
+        assert cache.get("k2") is None
+        assert cache.get("k1") == "v1"
+        assert cache.get("k3") == "v3"
+    
+    def test_empty_response_not_cached(self):
+        """测试空响应不缓存"""
+        cache = LLMResponseCache()
+        cache.set("k", "")
+        assert cache.get("k") is None
+    
+    def test_disk_cache_survives_new_instance(self, tmp_path):
+        """测试磁盘缓存在新实例中仍可命中"""
+        LLMResponseCache(cache_dir=tmp_path).set("k", "响应内容")
+        assert LLMResponseCache(cache_dir=tmp_path).get("k") == "响应内容"
+    
+    def test_single_flight_merges_concurrent_requests(self):
+        """测试相同请求并发时只调用一次"""
+        cache = LLMResponseCache()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            cache.set("k", "响应")
+            return "响应"
+        
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            first = pool.submit(cache.single_flight, "k", compute)
+            started.wait(5)
+            second = pool.submit(cache.single_flight, "k", compute)
+            release.set()
+            assert first.result() == second.result() == "响应"
+        assert len(calls) == 1
+        assert cache.single_flight("k", compute) == "响应"
+        assert len(calls) == 1
+
+
+class TestBuildLLMInput:
+    """测试提示词拼接"""
+    
+    def test_prompt_prefix_is_stable(self):
+        """测试提示词末尾空白不影响前缀，输入数据拼接在固定分隔符之后"""
+        first = build_llm_input("提示词\n", {"text": "块1"})
+        second = build_llm_input("提示词", {"text": "块2"})
+        prefix = "提示词\n\n输入内容：\n"
+        assert first.startswith(prefix) and second.startswith(prefix)
+        assert first.endswith('"块1"\n}')
+    
+    def test_without_input_data(self):
+        """测试没有输入数据时原样返回提示词"""
+        assert build_llm_input("提示词\n") == "提示词\n"
+    
+    def test_compact_input(self):
+        """测试紧凑模式下字典输入不缩进"""
+        assert build_llm_input("提示词", {"a": [1, 2]}, compact=True).endswith('{"a":[1,2]}')
+
+
+
+@pytest.fixture
+def truncating_encoder(monkeypatch):
+    """用只看前64个字符的假向量模型替换sentence-transformers，模拟真实模型的长度上限"""
+    np = pytest.importorskip("numpy")
+    
+    class TruncatingEncoder:
+        dim = 1024
+        
+        def __init__(self, model_name):
+            pass
+        
+        def get_sentence_embedding_dimension(self):
+            return self.dim
+        
+        def encode(self, texts, normalize_embeddings=True):
+            vectors = np.zeros((len(texts), self.dim), dtype='float32')
+            for row, text in enumerate(texts):
+                vectors[row, zlib.crc32(text[:64].encode('utf-8')) % self.dim] = 1.0
+            return vectors
+    
+    monkeypatch.setattr(llm_cache, "np", np)
+    monkeypatch.setattr(llm_cache, "faiss", None)
+    monkeypatch.setattr(llm_cache, "SentenceTransformer", TruncatingEncoder)
+
+
+class TestSemanticResponseCache:
+    """测试LLM语义缓存"""
+    
+    PROMPT = "请根据以下字幕划分话题。" * 500
+    
+    def test_inputs_under_long_prompt_do_not_collide(self, truncating_encoder):
+        """测试同一长提示词下的不同输入不会互相命中"""
+        cache = SemanticResponseCache()
+        cache.set("qwen-plus", self.PROMPT, [{"text": "第一段字幕"}], "响应一")
+        
+        assert cache.get("qwen-plus", self.PROMPT, [{"text": "第二段字幕"}]) is None
+        assert cache.get("qwen-plus", self.PROMPT, [{"text": "第一段字幕"}]) == "响应一"
+    
+    def test_prompt_and_model_must_match_exactly(self, truncating_encoder):
+        """测试提示词或模型不同时不复用响应"""
+        cache = SemanticResponseCache()
+        cache.set("qwen-plus", self.PROMPT, "输入", "响应")
+        
+        assert cache.get("qwen-plus", self.PROMPT + "。", "输入") is None
+        assert cache.get("qwen-turbo", self.PROMPT, "输入") is None
+    
+    def test_persisted_entries_survive_new_instance(self, truncating_encoder, tmp_path):
+        """测试磁盘上的语义缓存在新实例中仍可命中"""
+        cache = SemanticResponseCache(cache_dir=tmp_path)
+        cache.set("qwen-plus", self.PROMPT, "输入", "响应")
+        assert not list(tmp_path.iterdir())  # 延迟合并写盘
+        cache.flush()
+        
+        assert SemanticResponseCache(cache_dir=tmp_path).get("qwen-plus", self.PROMPT, "输入") == "响应"
+    
+    def test_mismatched_files_drop_partition(self, truncating_encoder, tmp_path):
+        """测试索引与响应列表不一致（只写入了其中一个文件）时丢弃该分区，而不是查询时报错"""
+        cache = SemanticResponseCache(cache_dir=tmp_path)
+        cache.set("qwen-plus", self.PROMPT, "输入一", "响应一")
+        cache.flush()
+        cache.set("qwen-plus", self.PROMPT, "输入二", "响应二")
+        cache.flush()
+        
+        entries_path = tmp_path / "semantic_partitions.json"
+        partitions = json.loads(entries_path.read_text(encoding='utf-8'))
+        entries_path.write_text(json.dumps({k: v[:1] for k, v in partitions.items()}), encoding='utf-8')
+        
+        reopened = SemanticResponseCache(cache_dir=tmp_path)
+        assert reopened.get("qwen-plus", self.PROMPT, "输入二") is None
+        reopened.set("qwen-plus", self.PROMPT, "输入二", "响应二")
+        assert reopened.get("qwen-plus", self.PROMPT, "输入二") == "响应二"
+        reopened.flush()
@@ -0,0 +1,162 @@
+"""
+通义千问客户端单元测试
+"""
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from src.utils.llm_client import LLMClient, _JSONEndDetector
+from src.utils.siliconflow_client import SiliconFlowClient
+
+
+def _rest_session(post):
+    """构造post行为可控的共享会话"""
+    session = MagicMock()
+    session.post.side_effect = post
+    return session
+
+
+def _detect(chunks):
+    """逐段喂入流式输出，返回提前停止时已接收的文本，未停止时返回None"""
+    detector = _JSONEndDetector()
+    received = ""
+    for chunk in chunks:
+        end = detector.feed(chunk)
+        if end >= 0:
+            return received + chunk[:end + 1]
+        received += chunk
+    return None
+
+
+class TestJSONEndDetector:
+    """测试流式输出中JSON结束位置的检测"""
+    
+    def test_stops_after_leading_json(self):
+        """测试响应以JSON开头时在其结束处停止"""
+        assert _detect(['  [{"a": 1}]', "\n以上是结果"]) == '  [{"a": 1}]'
+    
+    def test_ignores_brackets_in_prose(self):
+        """测试说明文字中的括号不会被当成JSON提前停止"""
+        assert _detect(["好的，见下方[1]：\n", '[{"a": 1}]', "\n完毕"]) is None
+    
+    def test_stops_after_code_fence(self):
+        """测试说明文字之后代码块中的JSON可以提前停止"""
+        chunks = ["好的，见下方[1]：\n```json\n", '[{"a": 1}]', "\n```\n补充说明"]
+        assert _detect(chunks) == '好的，见下方[1]：\n```json\n[{"a": 1}]'
+    
+    def test_code_fence_split_across_chunks(self):
+        """测试代码块标记被拆到多段、前面有大量括号说明文字时仍能识别"""
+        chunks = ["参见[1]和{注}。" * 200 + "\n``", "`js", "on\n", "[1, ", "2]", "\n```"]
+        assert _detect(chunks).endswith("```json\n[1, 2]")
+    
+    def test_escaped_quotes_in_strings(self):
+        """测试字符串中的转义引号和括号不影响深度跟踪"""
+        text = '{"t": "他说\\"]}\\"", "n": [1]}'
+        assert _detect([text + " 尾部"]) == text
+    
+    def test_chunk_split_inside_escape(self):
+        """测试转义符和括号被拆到不同分段时仍能正确识别"""
+        chunks = ['{"t": "a\\', '"]', '"', ', "n": {', "}}", " 尾部"]
+        assert _detect(chunks) == '{"t": "a\\"]", "n": {}}'
+    
+    def test_early_stopped_output_not_cached(self):
+        """测试提前停止的流式输出不写入缓存"""
+        client = LLMClient(api_key="sk-test", model="qwen-plus", enable_cache=True)
+        deltas = ['[{"a": 1}]', "\n多余的说明"]
+        responses = [MagicMock(status_code=200, output=MagicMock(text=d)) for d in deltas]
+        with patch("src.utils.llm_client.Generation.call", return_value=iter(responses)):
+            assert client.call_stream("流式缓存测试提示词") == '[{"a": 1}]'
+        
+        key = client._cache.make_key(client.model, "流式缓存测试提示词", None)
+        assert client._cache.get(key) is None
+
+
+class TestRESTFallback:
+    """测试REST直连失败时是否回退到SDK"""
+    
+    def setup_method(self):
+        self.client = LLMClient(api_key="sk-test", model="qwen-plus")
+    
+    def _call(self, post):
+        with patch("src.utils.llm_client._get_rest_session", return_value=_rest_session(post)), \
+             patch("src.utils.llm_client.Generation.call") as sdk_call:
+            try:
+                return self.client._call_rest("输入", "sk-test"), sdk_call
+            finally:
+                sdk_call.assert_not_called()
+    
+    def test_connect_failure_falls_back(self):
+        """测试连接未建立时返回None，由调用方回退到SDK"""
+        reason = NewConnectionError(None, "Connection refused")
+        error = requests.ConnectionError(MaxRetryError(None, "/", reason=reason))
+        
+        result, _ = self._call(error)
+        assert result is None
+        assert self._call(requests.ConnectTimeout())[0] is None
+    
+    def test_read_timeout_propagates(self):
+        """测试请求已发出后的读取超时直接抛出，不再经SDK重发"""
+        with pytest.raises(requests.ReadTimeout):
+            self._call(requests.ReadTimeout())
+    
+    def test_connection_reset_after_send_propagates(self):
+        """测试请求发出后连接被重置时直接抛出"""
+        error = requests.ConnectionError(ConnectionResetError(104, "Connection reset by peer"))
+        with pytest.raises(requests.ConnectionError):
+            self._call(error)
+    
+    def test_non_object_body_raises_retryable_error(self):
+        """测试响应体不是JSON对象时抛出可重试的异常，而不是AttributeError"""
+        list_body = MagicMock(status_code=200)
+        list_body.json.return_value = ["不是对象"]
+        html_body = MagicMock(status_code=502)
+        html_body.json.side_effect = ValueError("不是JSON")
+        
+        for resp in (list_body, html_body):
+            with pytest.raises(Exception) as exc_info:
+                self._call(lambda *args, **kwargs: resp)
+            # ValueError在call_with_retry中按不可重试处理
+            assert not isinstance(exc_info.value, (AttributeError, ValueError))
+    
+    def test_sdk_fallback_used_by_request(self):
+        """测试_request在REST连接失败时调用一次SDK"""
+        with patch.object(self.client, "_call_rest", return_value=None), \
+             patch("src.utils.llm_client.Generation.call") as sdk_call:
+            sdk_call.return_value = MagicMock(status_code=200,
+                                              output=MagicMock(text="回复内容足够长了", finish_reason="stop"))
+            assert self.client.call("提示词", use_cache=False) == "回复内容足够长了"
+            sdk_call.assert_called_once()
+
+
+class TestSemanticCacheFailures:
+    """测试语义缓存出错时不影响API调用"""
+    
+    @staticmethod
+    def _broken_semantic_cache():
+        """构造查询和写入都会失败的语义缓存"""
+        cache = MagicMock()
+        cache.get.side_effect = OSError("模型下载失败")
+        cache.set.side_effect = IndexError("索引损坏")
+        return cache
+    
+    @pytest.mark.parametrize("client_cls", [LLMClient, SiliconFlowClient])
+    def test_lookup_and_store_errors_are_ignored(self, client_cls):
+        """测试查询失败按未命中处理，写入失败只记录日志"""
+        client = client_cls(api_key="sk-test")
+        client._semantic_cache = self._broken_semantic_cache()
+        
+        assert client._cached_response(None, "提示词", "输入") is None
+        client._store_response(None, "提示词", "输入", "响应")
+        client._semantic_cache.set.assert_called_once()
+    
+    def test_call_returns_response_despite_broken_cache(self):
+        """测试语义缓存损坏时调用仍返回响应，且只请求一次"""
+        client = LLMClient(api_key="sk-test", model="qwen-plus", use_rest_session=False)
+        client._semantic_cache = self._broken_semantic_cache()
+        with patch("src.utils.llm_client.Generation.call") as sdk_call:
+            sdk_call.return_value = MagicMock(status_code=200,
+                                              output=MagicMock(text="回复内容足够长了", finish_reason="stop"))
+            assert client.call_with_retry("提示词", "输入") == "回复内容足够长了"
+            sdk_call.assert_called_once()